@@ -297,7 +297,7 @@ class Commander(BitcoinTestFramework):
         self.log.info(f"PRNG seed is: {seed}")
 
         self.log.debug("Setting up network thread")
-        self.network_thread = NetworkThread()
+        self.network_thread = NetworkThread(num_loops=self.options.network_loops)
         self.network_thread.start()
 
         self.success = TestStatus.PASSED
@@ -455,6 +455,13 @@ class Commander(BitcoinTestFramework):
             action="store_true",
             help="use BIP324 v2 connections between all nodes by default",
         )
+        parser.add_argument(
+            "--network-loops",
+            dest="network_loops",
+            default=1,
+            type=int,
+            help="spread outbound P2P connections over this many event loop threads (default: 1)",
+        )
         parser.add_argument(
             "--test_methods",
             dest="test_methods",
@@ -633,13 +640,13 @@ class Commander(BitcoinTestFramework):
                 # create signet txs for signing
                 signet_spk = tmpl["signet_challenge"]
                 signet_spk_bin = bytes.fromhex(signet_spk)
-                txs = block.vtx[:]
-                txs[0] = CTransaction(txs[0])
-                txs[0].vout[-1].scriptPubKey += CScriptOp.encode_op_pushdata(SIGNET_HEADER)
-                hashes = []
-                for tx in txs:
-                    hashes.append(ser_uint256(tx.txid_int))
-                mroot = block.get_merkle_root(hashes)
+                signet_cb = CTransaction(block.vtx[0])
+                signet_cb.vout[-1].scriptPubKey += CScriptOp.encode_op_pushdata(SIGNET_HEADER)
+                # Only the coinbase differs between this root and the final one,
+                # so keep the tree and rehash just the coinbase's path each time
+                merkle_tree = block.merkle_tree()
+                merkle_tree.set_leaf(0, ser_uint256(signet_cb.txid_int))
+                mroot = merkle_tree.root
                 sd = b""
                 sd += struct.pack("<i", block.nVersion)
                 sd += ser_uint256(block.hashPrevBlock)
@@ -692,7 +699,8 @@ class Commander(BitcoinTestFramework):
                     SIGNET_HEADER + signet_solution
                 )
 
-                signed_block.hashMerkleRoot = signed_block.calc_merkle_root()
+                merkle_tree.set_leaf(0, ser_uint256(signed_block.vtx[0].txid_int))
+                signed_block.hashMerkleRoot = merkle_tree.root
                 try:
                     headhex = CBlockHeader.serialize(signed_block).hex()
                     cmd = ["bitcoin-util", "grind", headhex]
@@ -0,0 +1,289 @@
+import logging
+import queue
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from io import BytesIO
+
+from pyln.proto.message import Message
+from pyln.proto.message.array_types import SizedArrayType
+from pyln.proto.message.fundamental_types import FundamentalHexType, IntegerType
+from pyln.proto.wire import connect
+
+# Messages we keep around for wait_for() before the oldest are dropped
+RECV_BACKLOG = 1000
+# Messages send() queues before it blocks until the writer thread catches up
+SEND_BACKLOG = 1000
+# Seconds a send() blocked on a full queue waits before checking whether the session closed
+SEND_WAIT = 1
+
+
+class MessageStats:
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        # Seconds between send() and the message hitting the socket
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, size, latency=0.0):
+        self.count += 1
+        self.bytes += size
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "bytes": self.bytes,
+            "avg_latency_ms": 1000 * self.total_latency / self.count if self.count else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+        }
+
+
+# A message serialized once up front. Fixed-size fields (integers, hashes and
+# fixed-length byte arrays) can then be overwritten in place in the wire bytes,
+# skipping pyln's field-by-field encoding, which writes byte arrays one byte at a time.
+# Not thread safe: give every sending thread its own template.
+#
+#   htlc = MessageTemplate(Message(ns.get_msgtype("update_add_htlc"), channel_id=bytes(32), id=0,
+#                                  amount_msat=1000, payment_hash=bytes(32), cltv_expiry=500,
+#                                  onion_routing_packet=bytes(1366)))
+#   for i in range(10000):
+#       session.send_template(htlc, id=i, payment_hash=random.randbytes(32))
+class MessageTemplate:
+    def __init__(self, msg):
+        self.name = msg.messagetype.name
+        buf = BytesIO()
+        msg.write(buf)
+        self.buf = bytearray(buf.getvalue())
+
+        # field name -> (offset, size, struct packer or None for raw bytes)
+        self.fields = {}
+        offset = 2  # message type
+        for field in msg.messagetype.fields:
+            if field.name not in msg.fields and field.option is not None:
+                break
+            part = BytesIO()
+            field.fieldtype.write(part, msg.fields.get(field.name), msg.fields)
+            size = len(part.getvalue())
+            fieldtype = field.fieldtype
+            if isinstance(fieldtype, IntegerType):
+                self.fields[field.name] = (offset, size, struct.Struct(fieldtype.structfmt))
+            elif isinstance(fieldtype, FundamentalHexType) or (
+                isinstance(fieldtype, SizedArrayType) and fieldtype.elemtype.name == "byte"
+            ):
+                self.fields[field.name] = (offset, size, None)
+            offset += size
+
+    def encode(self, **fields):
+        """Return the wire bytes of the template with the given fields replaced"""
+        buf = self.buf
+        for name, value in fields.items():
+            try:
+                offset, size, packer = self.fields[name]
+            except KeyError:
+                raise ValueError(f"{self.name}.{name} is not a fixed-size field") from None
+            if packer:
+                packer.pack_into(buf, offset, value)
+            else:
+                if len(value) != size:
+                    raise ValueError(f"{self.name}.{name} must be {size} bytes, got {len(value)}")
+                buf[offset:offset + size] = value
+        return bytes(buf)
+
+
+# A BOLT#8 connection to a single peer with background reader and writer threads.
+# Incoming messages are parsed against the given MessageNamespace as they arrive,
+# while send() only queues the message so callers can stream at full speed,
+# blocking once max_queued messages are waiting for a peer that reads slower.
+class LNP2PSession:
+    def __init__(self, namespace, privkey, node_id, host, port, log=None, max_queued=SEND_BACKLOG):
+        self.namespace = namespace
+        self.privkey = privkey
+        self.node_id = node_id
+        self.host = host
+        self.port = int(port)
+        self.log = log or logging.getLogger("LNP2PSession")
+        # MessageNamespace looks message numbers up with a linear scan
+        self.types_by_number = {m.number: m for m in namespace.messagetypes.values()}
+
+        self.connection = None
+        self.send_queue = queue.Queue(maxsize=max_queued)
+        self.received = deque(maxlen=RECV_BACKLOG)
+        self.recv_cond = threading.Condition()
+        self.sent_stats = defaultdict(MessageStats)
+        self.recv_stats = defaultdict(MessageStats)
+        self.stats_lock = threading.Lock()
+        self.closed = threading.Event()
+        # Held for every write, so the reader can answer pings without
+        # waiting behind the send queue
+        self.write_lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.threads = []
+        # Optional callback(session, msg) run on the reader thread for every parsed message
+        self.on_message = None
+
+    def connect(self):
+        self.connection = connect(self.privkey, self.node_id, self.host, self.port)
+        self.start_time = time.perf_counter()
+        self.threads = [
+            threading.Thread(target=self._reader, daemon=True),
+            threading.Thread(target=self._writer, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        # Nothing will be written anymore, make room so senders blocked on a
+        # full queue return and the writer wakes up to the None
+        while True:
+            try:
+                self.send_queue.get_nowait()
+                self.send_queue.task_done()
+            except queue.Empty:
+                break
+        try:
+            self.send_queue.put_nowait(None)
+        except queue.Full:
+            pass
+        with self.send_queue.all_tasks_done:
+            self.send_queue.all_tasks_done.notify_all()
+        try:
+            self.connection.connection.close()
+        except Exception:
+            pass
+        with self.recv_cond:
+            self.recv_cond.notify_all()
+
+    def handshake(self, init_msg, timeout=30):
+        """Exchange init messages, which must happen before anything else (BOLT#1)"""
+        self.send(init_msg)
+        return self.wait_for("init", timeout)
+
+    def send(self, msg):
+        """Queue a pyln Message for sending and return immediately"""
+        buf = BytesIO()
+        msg.write(buf)
+        self.send_raw(buf.getvalue(), msg.messagetype.name)
+
+    def send_template(self, template, **fields):
+        """Queue a MessageTemplate with the given fields patched in"""
+        self.send_raw(template.encode(**fields), template.name)
+
+    def send_raw(self, data, name=None):
+        """Queue an already-encoded message, the fastest way to repeat a message.
+        Blocks while the send queue is full, messages sent after close() are dropped"""
+        if name is None:
+            name = self._type_name(int.from_bytes(data[:2], "big"))
+        item = (data, name, time.perf_counter())
+        while not self.closed.is_set():
+            try:
+                self.send_queue.put(item, timeout=SEND_WAIT)
+                return
+            except queue.Full:
+                pass
+
+    def wait_for(self, name, timeout=30):
+        """Block until a message of the given type arrives and return it"""
+        deadline = time.perf_counter() + timeout
+        with self.recv_cond:
+            while True:
+                for msg in self.received:
+                    if msg.messagetype.name == name:
+                        self.received.remove(msg)
+                        return msg
+                remaining = deadline - time.perf_counter()
+                if self.closed.is_set() or remaining <= 0:
+                    raise TimeoutError(f"No {name} message from {self.host} after {timeout}s")
+                self.recv_cond.wait(remaining)
+
+    def wait_until_sent(self, timeout=60):
+        deadline = time.perf_counter() + timeout
+        done = self.send_queue.all_tasks_done
+        with done:
+            while self.send_queue.unfinished_tasks and not self.closed.is_set():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise TimeoutError(f"Send queue to {self.host} not drained after {timeout}s")
+                done.wait(remaining)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.start_time
+        with self.stats_lock:
+            sent = {name: s.to_dict() for name, s in self.sent_stats.items()}
+            recv = {name: s.to_dict() for name, s in self.recv_stats.items()}
+        total_sent = sum(s["count"] for s in sent.values())
+        return {
+            "elapsed": elapsed,
+            "sent": sent,
+            "received": recv,
+            "send_rate": total_sent / elapsed if elapsed else 0.0,
+            "queued": self.send_queue.qsize(),
+        }
+
+    def _type_name(self, number):
+        msgtype = self.types_by_number.get(number)
+        return msgtype.name if msgtype else f"unknown_{number}"
+
+    def _writer(self):
+        while True:
+            item = self.send_queue.get()
+            if item is None or self.closed.is_set():
+                self.send_queue.task_done()
+                return
+            data, name, queued_at = item
+            ok = self._write(data, name, queued_at)
+            self.send_queue.task_done()
+            if not ok:
+                return
+
+    def _write(self, data, name, queued_at):
+        try:
+            with self.write_lock:
+                self.connection.send_message(data)
+        except Exception as e:
+            self.log.error(f"Send to {self.host} failed: {e}")
+            self.close()
+            return False
+        latency = time.perf_counter() - queued_at
+        with self.stats_lock:
+            self.sent_stats[name].add(len(data), latency)
+        return True
+
+    def _reader(self):
+        while not self.closed.is_set():
+            try:
+                data = self.connection.read_message()
+            except Exception as e:
+                if not self.closed.is_set():
+                    self.log.error(f"Connection to {self.host} lost: {e}")
+                    self.close()
+                return
+            try:
+                msg = Message.read(self.namespace, BytesIO(data))
+            except Exception:
+                msg = None
+            name = msg.messagetype.name if msg else self._type_name(int.from_bytes(data[:2], "big"))
+            with self.stats_lock:
+                self.recv_stats[name].add(len(data))
+            if msg is None:
+                self.log.debug(f"Could not parse message from peer:\n{data.hex()}")
+                continue
+            if name == "ping":
+                # Keep the connection alive, peers disconnect if we ignore pings.
+                # Written right away rather than queued behind a flood.
+                pong = Message(self.namespace.get_msgtype("pong"),
+                               ignored=bytes(msg.fields["num_pong_bytes"]))
+                buf = BytesIO()
+                pong.write(buf)
+                self._write(buf.getvalue(), "pong", time.perf_counter())
+            if self.on_message:
+                self.on_message(self, msg)
+            with self.recv_cond:
+                self.received.append(msg)
+                self.recv_cond.notify_all()
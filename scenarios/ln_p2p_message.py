@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-from io import BytesIO
 import random
 
 from commander import Commander
@@ -16,7 +15,8 @@ from commander import Commander
 # https://github.com/ElementsProject/lightning/tree/master/contrib/pyln-spec
 ########
 from pyln.proto.message import Message, MessageNamespace
-from pyln.proto.wire import PrivateKey, PublicKey, connect
+from pyln.proto.wire import PrivateKey, PublicKey
+from ln_framework.p2p import LNP2PSession
 
 # genesis block hash is used as a chain identifer in some messages
 GENESIS = {
@@ -24,6 +24,20 @@ GENESIS = {
     "signet": "00000008819873e925422c1ff0f99f7cc9bbb232af63a077a480a3633bee1ef6"
 }
 
+# feature bits naively copied from an init message sent by LND
+LND_FEATURES = bytes.fromhex(
+    "800000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000000000000000000000000000000000000000" +
+    "000000000000002000888252a1")
+
 # Define p2p messages from BOLT specs
 ns = MessageNamespace([
     # init (BOLT#1)
@@ -126,9 +140,6 @@ class LNP2PMessage(Commander):
     def run_test(self):
         # Clear the Warnet default random seed
         random.seed(None)
-        # Determine what network we are in
-        chain = self.nodes[0].chain
-        chain_hash = GENESIS[chain]
 
         # Find the target node
         pk, host = self.options.peer.split("@")
@@ -138,62 +149,50 @@ class LNP2PMessage(Commander):
         # Create an ephemeral identity key for ourselves
         id_privkey = PrivateKey(random.randbytes(32))
 
-        # Establish a p2p connection to the peer
-        connection = connect(id_privkey, PublicKey(bytes.fromhex(pk)), host, port)
+        # Establish a p2p connection to the peer. The session reads and parses
+        # incoming messages on a background thread (answering pings for us)
+        # and writes queued outgoing messages on another, so send() never blocks.
+        session = LNP2PSession(ns, id_privkey, PublicKey(bytes.fromhex(pk)), host, port, self.log)
+        session.connect()
+
+        # Log every message the peer sends us
+        def log_message(session, msg):
+            self.log.info(f"<<< {msg.messagetype} {msg.to_py()}")
+
+        session.on_message = log_message
 
-        # Define helper functions for connection I/O
         def send(msg):
-            buf = BytesIO()
-            msg.write(buf)
-            connection.send_message(buf.getvalue())
+            session.send(msg)
             self.log.info(f">>> {msg.messagetype} {msg.to_py()}")
 
-        def recv():
-            msg = connection.read_message()
-            stream = BytesIO(msg)
-            try:
-                msg = Message.read(ns, stream)
-                self.log.info(f"<<< {msg.messagetype} {msg.to_py()}")
-            except:
-                self.log.error(f"Could not parse message from peer:\n{stream.getvalue().hex()}")
-
-            ########
-            # API for the Message class:
-            # https://github.com/ElementsProject/lightning/blob/c7531b0f8f5fc14a46cd05525f8cb9b3bdebeb5d/contrib/pyln-proto/pyln/proto/message/message.py#L594
-            # (messagetype: MessageType, **kwargs)
-            # "MessageType is the type of this msg, with fields.
-            #  Fields can either be valid values for the type,"
-            #  or if they are strings they are converted according
-            #  to the field type"
-            ########
-            init_msg = Message(ns.get_msgtype("init"),
-                                globalfeatures=b"\x12\x00",
-                                # feature bits naively copied from a message sent by LND
-                                features=bytes.fromhex(
-                                    "800000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000000000000000000000000000000000000000" +
-                                    "000000000000002000888252a1"))
-            # Send init
-            send(init_msg)
-            # Receive init
-            recv()
-
-            # Build ping
-            ping_msg = Message(ns.get_msgtype("ping"),
-                               num_pong_bytes=0,
-                               ignored=b"")
-            # Send ping
-            send(ping_msg)
-            # Receive pong
-            recv()
+        ########
+        # API for the Message class:
+        # https://github.com/ElementsProject/lightning/blob/c7531b0f8f5fc14a46cd05525f8cb9b3bdebeb5d/contrib/pyln-proto/pyln/proto/message/message.py#L594
+        # (messagetype: MessageType, **kwargs)
+        # "MessageType is the type of this msg, with fields.
+        #  Fields can either be valid values for the type,"
+        #  or if they are strings they are converted according
+        #  to the field type"
+        ########
+        init_msg = Message(ns.get_msgtype("init"),
+                           globalfeatures=b"\x12\x00",
+                           features=LND_FEATURES)
+        # Send init and wait for the peer's init
+        self.log.info(f">>> {init_msg.messagetype} {init_msg.to_py()}")
+        session.handshake(init_msg)
+
+        # Build ping
+        ping_msg = Message(ns.get_msgtype("ping"),
+                           num_pong_bytes=0,
+                           ignored=b"")
+        # Send ping and wait for pong
+        send(ping_msg)
+        session.wait_for("pong")
+
+        # Counters and send latency per message type
+        self.log.info(f"Session stats: {session.stats()}")
+        session.close()
+
 
 def main():
     LNP2PMessage("").main()
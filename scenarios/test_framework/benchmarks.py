@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Micro benchmarks for the hot paths of the test framework.
+
+Run from the scenarios directory:
+
+    python3 -m test_framework.benchmarks [name ...]
+"""
+import random
+import sys
+import time
+
+from test_framework.crypto import native
+from test_framework.crypto.chacha20 import CHACHA20_TESTS, FSCHACHA20_TESTS, FSChaCha20, chacha20_block
+from test_framework.crypto.ellswift import ellswift_create, ellswift_ecdh_xonly
+from test_framework.key import (
+    ECKey,
+    compute_xonly_pubkey,
+    generate_privkey,
+    sign_schnorr,
+    verify_schnorr,
+    verify_schnorr_batch,
+)
+from test_framework.messages import (
+    CBlock,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxInWitness,
+    CTxOut,
+    HeaderHasher,
+    LazyBlock,
+    MAX_BLOCK_WEIGHT,
+    MerkleTree,
+    from_binary,
+    msg_block,
+    ser_uint256,
+)
+from test_framework.p2p import P2PConnection
+from test_framework.v2_p2p import EncryptedP2PState
+
+
+def timeit(func, min_time=1.0):
+    """Call func repeatedly for at least min_time seconds and return (calls, seconds)"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls, elapsed
+
+
+def make_full_block(weight=MAX_BLOCK_WEIGHT):
+    """Build a block of 2-in 2-out P2WPKH-shaped transactions filling up to weight"""
+    rng = random.Random(0)
+    block = CBlock()
+    tx_weight = None
+    while tx_weight is None or (len(block.vtx) + 1) * tx_weight <= weight - 4000:
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(rng.getrandbits(256), i)) for i in range(2)]
+        tx.vout = [CTxOut(1000, b"\x00\x14" + rng.randbytes(20)) for _ in range(2)]
+        tx.wit.vtxinwit = [CTxInWitness() for _ in range(2)]
+        for inwit in tx.wit.vtxinwit:
+            inwit.scriptWitness.stack = [rng.randbytes(72), rng.randbytes(33)]
+        tx_weight = tx_weight or tx.get_weight()
+        block.vtx.append(tx)
+    return block
+
+
+def bench_block_serialize():
+    block = make_full_block()
+    size = len(block.serialize())
+    calls, elapsed = timeit(block.serialize)
+    print(f"block_serialize: {len(block.vtx)} txs, {size} bytes, weight {block.get_weight()}: "
+          f"{1000 * elapsed / calls:.1f} ms/block, {calls * size / elapsed / 1e6:.1f} MB/s")
+
+
+def bench_block_deserialize():
+    data = make_full_block().serialize()
+    for cls in (CBlock, LazyBlock):
+        calls, elapsed = timeit(lambda: from_binary(cls, data))
+        print(f"block_deserialize ({cls.__name__}): {len(data)} bytes: "
+              f"{1000 * elapsed / calls:.1f} ms/block, {calls * len(data) / elapsed / 1e6:.1f} MB/s")
+
+
+def bench_merkle_root():
+    hashes = [ser_uint256(tx.txid_int) for tx in make_full_block().vtx]
+    calls, elapsed = timeit(lambda: MerkleTree(hashes).root)
+    print(f"merkle_root: {len(hashes)} leaves: {1000 * elapsed / calls:.2f} ms/tree")
+    tree = MerkleTree(hashes)
+    calls, elapsed = timeit(lambda: tree.set_leaf(0, hashes[1]))
+    print(f"merkle_root: coinbase update: {1e6 * elapsed / calls:.1f} us")
+
+
+def bench_header_hash():
+    block = make_full_block(4000)
+    block.hashMerkleRoot = block.calc_merkle_root()
+
+    def naive():
+        for _ in range(1000):
+            block.nNonce += 1
+            block.hash_int
+
+    calls, elapsed = timeit(naive)
+    print(f"header_hash: hash_int: {1000 * calls / elapsed:.0f} nonces/s")
+    hasher = HeaderHasher(block)
+    calls, elapsed = timeit(lambda: hasher.scan(0, 0, HeaderHasher.BATCH))
+    print(f"header_hash: midstate: {HeaderHasher.BATCH * calls / elapsed:.0f} nonces/s")
+
+
+def bench_secp256k1():
+    key = ECKey()
+    key.generate()
+    pubkey = key.get_pubkey()
+    msg = bytes(range(32))
+    sig = key.sign_ecdsa(msg)
+    xonly, _ = compute_xonly_pubkey(key.get_bytes())
+    schnorr_sig = sign_schnorr(key.get_bytes(), msg)
+    priv, ellswift_ours = ellswift_create()
+    _, ellswift_theirs = ellswift_create()
+    ops = [
+        ("ecdsa_sign", lambda: key.sign_ecdsa(msg)),
+        ("ecdsa_verify", lambda: pubkey.verify_ecdsa(sig, msg)),
+        ("schnorr_sign", lambda: sign_schnorr(key.get_bytes(), msg)),
+        ("schnorr_verify", lambda: verify_schnorr(xonly, schnorr_sig, msg)),
+        ("ellswift_ecdh", lambda: ellswift_ecdh_xonly(ellswift_theirs, priv)),
+    ]
+    for name, op in ops:
+        calls, elapsed = timeit(op)
+        print(f"secp256k1: {name}: {calls / elapsed:.0f} ops/s")
+
+    items = []
+    for _ in range(64):
+        privkey = generate_privkey()
+        items.append((compute_xonly_pubkey(privkey)[0], sign_schnorr(privkey, msg), msg))
+    calls, elapsed = timeit(lambda: verify_schnorr_batch(items))
+    print(f"secp256k1: schnorr_verify_batch ({len(items)} per batch): {calls * len(items) / elapsed:.0f} ops/s")
+
+
+def bench_fschacha20():
+    # Only time an implementation that reproduces the RFC 8439 and BIP324 vectors
+    for hex_key, nonce, counter, hex_output in CHACHA20_TESTS:
+        nonce_bytes = nonce[0].to_bytes(4, 'little') + nonce[1].to_bytes(8, 'little')
+        assert chacha20_block(bytes.fromhex(hex_key), nonce_bytes, counter).hex() == hex_output
+    for hex_plaintext, hex_key, rekey_interval, hex_ciphertext in FSCHACHA20_TESTS:
+        fsc20 = FSChaCha20(bytes.fromhex(hex_key), rekey_interval)
+        for _ in range(rekey_interval):
+            fsc20.crypt(bytes.fromhex(hex_plaintext))
+        assert fsc20.crypt(bytes.fromhex(hex_plaintext)).hex() == hex_ciphertext
+
+    backend = native.backends()["chacha20"]
+    # 3 bytes is the BIP324 length field, the only thing FSChaCha20 encrypts on the wire
+    for size in (3, 1024, 1 << 20):
+        fsc20 = FSChaCha20(bytes(32))
+        chunk = bytes(size)
+        calls, elapsed = timeit(lambda: fsc20.crypt(chunk))
+        print(f"fschacha20 ({backend}): {size} byte chunks: {calls / elapsed:.1f} chunks/s, "
+              f"{calls * size / elapsed / 1e6:.2f} MB/s")
+
+
+def bench_v2_transport():
+    sender = EncryptedP2PState(initiating=True, net="regtest")
+    receiver = EncryptedP2PState(initiating=False, net="regtest")
+    secret = bytes(range(32))
+    sender.initialize_v2_transport(secret)
+    receiver.initialize_v2_transport(secret)
+    backend = native.backends()["chacha20poly1305"]
+    # 1 MB is the size of a typical full block message
+    for size in (256, 1_000_000):
+        contents = bytes(size)
+
+        def roundtrip():
+            # The receiver gets bytes, as read from a socket
+            packet = bytes(sender.v2_enc_packet(contents))
+            length, received = receiver.v2_receive_packet(packet)
+            assert length == len(packet) and received == contents
+
+        for name, op in (("send", lambda: sender.v2_enc_packet(contents)), ("send+receive", roundtrip)):
+            # Keep the receiver in step with the packets the sender encrypted
+            sender.initialize_v2_transport(secret)
+            receiver.initialize_v2_transport(secret)
+            calls, elapsed = timeit(op)
+            print(f"v2_transport ({backend}): {name} {size} byte packets: {calls / elapsed:.1f} packets/s, "
+                  f"{calls * size / elapsed / 1e6:.2f} MB/s")
+
+
+class NullConnection(P2PConnection):
+    """A P2PConnection without a socket that drops every message it reads"""
+    def __init__(self, v2_state=None):
+        super().__init__()
+        self.peer_connect_helper('0', 0, 'regtest', 1)
+        self.v2_state = v2_state
+
+    def on_message(self, message):
+        pass
+
+
+def bench_p2p_receive(count=20):
+    block = msg_block(make_full_block())
+    for version in ("v1", "v2"):
+        sender, receiver = NullConnection(), NullConnection()
+        if version == "v2":
+            for conn, initiating in ((sender, True), (receiver, False)):
+                conn.v2_state = EncryptedP2PState(initiating=initiating, net="regtest")
+                conn.v2_state.initialize_v2_transport(bytes(range(32)))
+                conn.v2_state.tried_v2_handshake = True
+        # Encrypted packets can only be read once, so build all of them up front
+        messages = [bytes(sender.build_message(block)) for _ in range(count)]
+        # Skip decoding the block, this times getting its payload out of the socket reads
+        receiver.lazy_messages = True
+        start = time.perf_counter()
+        for wire in messages:
+            # asyncio hands data_received at most 64 KiB per read
+            for i in range(0, len(wire), 65536):
+                receiver.data_received(wire[i:i + 65536])
+        elapsed = time.perf_counter() - start
+        size = len(messages[0])
+        print(f"p2p_receive ({version}): {size} byte block in {(size + 65535) // 65536} reads: "
+              f"{1000 * elapsed / count:.1f} ms/block, {count * size / elapsed / 1e6:.1f} MB/s")
+
+
+BENCHMARKS = {
+    "block_serialize": bench_block_serialize,
+    "block_deserialize": bench_block_deserialize,
+    "merkle_root": bench_merkle_root,
+    "header_hash": bench_header_hash,
+    "secp256k1": bench_secp256k1,
+    "fschacha20": bench_fschacha20,
+    "v2_transport": bench_v2_transport,
+    "p2p_receive": bench_p2p_receive,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -13,7 +13,8 @@ anything but tests.
 
 import unittest
 
-from .chacha20 import chacha20_block, REKEY_INTERVAL
+from . import native
+from .chacha20 import chacha20_block, chacha20_keystream, xor_bytes, REKEY_INTERVAL
 from .poly1305 import Poly1305
 
 
@@ -23,43 +24,52 @@ def pad16(x):
     return b'\x00' * (16 - (len(x) % 16))
 
 
-def aead_chacha20_poly1305_encrypt(key, nonce, aad, plaintext):
+def aead_tag(key, nonce, aad, ciphertext):
+    """Compute the Poly1305 tag of a ChaCha20Poly1305 ciphertext."""
+    poly1305 = Poly1305(chacha20_block(key, nonce, 0)[:32])
+    # Assemble the padded MAC input in one allocation
+    mac_data = b''.join((aad, pad16(aad), ciphertext, pad16(ciphertext),
+                         len(aad).to_bytes(8, 'little'), len(ciphertext).to_bytes(8, 'little')))
+    return poly1305.tag(mac_data)
+
+
+def aead_chacha20_poly1305_encrypt_into_python(key, nonce, aad, plaintext, out):
+    """Encrypt a plaintext using ChaCha20Poly1305 into the start of the writable buffer out.
+
+    Returns the number of bytes written, len(plaintext) + 16."""
+    msg_len = len(plaintext)
+    keystream = chacha20_keystream(key, nonce, 1, (msg_len + 63) // 64)[:msg_len]
+    ciphertext = xor_bytes(keystream, plaintext)
+    out[:msg_len] = ciphertext
+    out[msg_len:msg_len + 16] = aead_tag(key, nonce, aad, ciphertext)
+    return msg_len + 16
+
+
+def aead_chacha20_poly1305_encrypt_python(key, nonce, aad, plaintext):
     """Encrypt a plaintext using ChaCha20Poly1305."""
     if plaintext is None:
         return None
-    ret = bytearray()
-    msg_len = len(plaintext)
-    for i in range((msg_len + 63) // 64):
-        now = min(64, msg_len - 64 * i)
-        keystream = chacha20_block(key, nonce, i + 1)
-        for j in range(now):
-            ret.append(plaintext[j + 64 * i] ^ keystream[j])
-    poly1305 = Poly1305(chacha20_block(key, nonce, 0)[:32])
-    mac_data = aad + pad16(aad)
-    mac_data += ret + pad16(ret)
-    mac_data += len(aad).to_bytes(8, 'little') + msg_len.to_bytes(8, 'little')
-    ret += poly1305.tag(mac_data)
+    ret = bytearray(len(plaintext) + 16)
+    aead_chacha20_poly1305_encrypt_into_python(key, nonce, aad, plaintext, ret)
     return bytes(ret)
 
 
-def aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext):
+def aead_chacha20_poly1305_decrypt_python(key, nonce, aad, ciphertext):
     """Decrypt a ChaCha20Poly1305 ciphertext."""
     if ciphertext is None or len(ciphertext) < 16:
         return None
     msg_len = len(ciphertext) - 16
-    poly1305 = Poly1305(chacha20_block(key, nonce, 0)[:32])
-    mac_data = aad + pad16(aad)
-    mac_data += ciphertext[:-16] + pad16(ciphertext[:-16])
-    mac_data += len(aad).to_bytes(8, 'little') + msg_len.to_bytes(8, 'little')
-    if ciphertext[-16:] != poly1305.tag(mac_data):
+    body = ciphertext[:-16]
+    if ciphertext[-16:] != aead_tag(key, nonce, aad, body):
         return None
-    ret = bytearray()
-    for i in range((msg_len + 63) // 64):
-        now = min(64, msg_len - 64 * i)
-        keystream = chacha20_block(key, nonce, i + 1)
-        for j in range(now):
-            ret.append(ciphertext[j + 64 * i] ^ keystream[j])
-    return bytes(ret)
+    keystream = chacha20_keystream(key, nonce, 1, (msg_len + 63) // 64)[:msg_len]
+    return xor_bytes(keystream, body)
+
+
+aead_chacha20_poly1305_encrypt = native.aead_chacha20_poly1305_encrypt or aead_chacha20_poly1305_encrypt_python
+aead_chacha20_poly1305_encrypt_into = (native.aead_chacha20_poly1305_encrypt_into or
+                                       aead_chacha20_poly1305_encrypt_into_python)
+aead_chacha20_poly1305_decrypt = native.aead_chacha20_poly1305_decrypt or aead_chacha20_poly1305_decrypt_python
 
 
 class FSChaCha20Poly1305:
@@ -68,17 +78,23 @@ class FSChaCha20Poly1305:
         self._key = initial_key
         self._packet_counter = 0
 
+    def _nonce(self):
+        return ((self._packet_counter % REKEY_INTERVAL).to_bytes(4, 'little') +
+                (self._packet_counter // REKEY_INTERVAL).to_bytes(8, 'little'))
+
+    def _advance(self, nonce):
+        if (self._packet_counter + 1) % REKEY_INTERVAL == 0:
+            rekey_nonce = b"\xFF\xFF\xFF\xFF" + nonce[4:]
+            self._key = aead_chacha20_poly1305_encrypt(self._key, rekey_nonce, b"", b"\x00" * 32)[:32]
+        self._packet_counter += 1
+
     def _crypt(self, aad, text, is_decrypt):
-        nonce = ((self._packet_counter % REKEY_INTERVAL).to_bytes(4, 'little') +
-                 (self._packet_counter // REKEY_INTERVAL).to_bytes(8, 'little'))
+        nonce = self._nonce()
         if is_decrypt:
             ret = aead_chacha20_poly1305_decrypt(self._key, nonce, aad, text)
         else:
             ret = aead_chacha20_poly1305_encrypt(self._key, nonce, aad, text)
-        if (self._packet_counter + 1) % REKEY_INTERVAL == 0:
-            rekey_nonce = b"\xFF\xFF\xFF\xFF" + nonce[4:]
-            self._key = aead_chacha20_poly1305_encrypt(self._key, rekey_nonce, b"", b"\x00" * 32)[:32]
-        self._packet_counter += 1
+        self._advance(nonce)
         return ret
 
     def decrypt(self, aad, ciphertext):
@@ -87,6 +103,14 @@ class FSChaCha20Poly1305:
     def encrypt(self, aad, plaintext):
         return self._crypt(aad, plaintext, False)
 
+    def encrypt_into(self, aad, plaintext, out):
+        """Encrypt plaintext into the start of the writable buffer out, which must hold
+        len(plaintext) + 16 bytes. Returns the number of bytes written."""
+        nonce = self._nonce()
+        written = aead_chacha20_poly1305_encrypt_into(self._key, nonce, aad, plaintext, out)
+        self._advance(nonce)
+        return written
+
 
 # Test vectors from RFC8439 consisting of plaintext, aad, 32 byte key, 12 byte nonce and ciphertext
 AEAD_TESTS = [
@@ -191,11 +215,16 @@ class TestFrameworkAEAD(unittest.TestCase):
 
             enc_aead = FSChaCha20Poly1305(key)
             dec_aead = FSChaCha20Poly1305(key)
+            into_aead = FSChaCha20Poly1305(key)
 
             for _ in range(msg_idx):
                 enc_aead.encrypt(b"", None)
+                into_aead.encrypt(b"", None)
             ciphertext = enc_aead.encrypt(aad, plain)
             self.assertEqual(hex_cipher, ciphertext.hex())
+            out = bytearray(len(plain) + 20)
+            self.assertEqual(into_aead.encrypt_into(aad, plain, memoryview(out)[4:]), len(ciphertext))
+            self.assertEqual(out, bytes(4) + ciphertext)
 
             for _ in range(msg_idx):
                 dec_aead.decrypt(b"", None)
@@ -11,8 +11,11 @@ WARNING: This code is slow and trivially vulnerable to side channel attacks. Do
 anything but tests.
 """
 
+import random
 import unittest
 
+from . import native
+
 CHACHA20_INDICES = (
     (0, 4, 8, 12), (1, 5, 9, 13), (2, 6, 10, 14), (3, 7, 11, 15),
     (0, 5, 10, 15), (1, 6, 11, 12), (2, 7, 8, 13), (3, 4, 9, 14)
@@ -20,6 +23,10 @@ CHACHA20_INDICES = (
 
 CHACHA20_CONSTANTS = (0x61707865, 0x3320646e, 0x79622d32, 0x6b206574)
 REKEY_INTERVAL = 224 # packets
+# Blocks FSChaCha20 generates per refill. Batching only amortizes the per-call
+# overhead of a native backend, in pure Python it would compute blocks a rekey
+# may then throw away.
+KEYSTREAM_BATCH = 16 if native.chacha20_keystream else 1
 
 
 def rotl32(v, bits):
@@ -43,7 +50,7 @@ def chacha20_doubleround(s):
         s[b] = rotl32(s[b] ^ s[c], 7)
 
 
-def chacha20_block(key, nonce, cnt):
+def chacha20_block_python(key, nonce, cnt):
     """Compute the 64-byte output of the ChaCha20 block function.
     Takes as input a 32-byte key, 12-byte nonce, and 32-bit integer counter.
     """
@@ -63,6 +70,21 @@ def chacha20_block(key, nonce, cnt):
     # Produce byte output
     return b''.join(state[i].to_bytes(4, 'little') for i in range(16))
 
+
+def chacha20_keystream_python(key, nonce, cnt, nblocks):
+    """Return nblocks consecutive ChaCha20 blocks, starting at block counter cnt."""
+    return b''.join(chacha20_block_python(key, nonce, cnt + i) for i in range(nblocks))
+
+
+def xor_bytes(a, b):
+    """XOR two equally long byte strings as big integers instead of byte by byte."""
+    n = len(b)
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(n, 'little')
+
+
+chacha20_block = native.chacha20_block or chacha20_block_python
+chacha20_keystream = native.chacha20_keystream or chacha20_keystream_python
+
 class FSChaCha20:
     """Rekeying wrapper stream cipher around ChaCha20."""
     def __init__(self, initial_key, rekey_interval=REKEY_INTERVAL):
@@ -70,24 +92,29 @@ class FSChaCha20:
         self._rekey_interval = rekey_interval
         self._block_counter = 0
         self._chunk_counter = 0
-        self._keystream = b''
+        # Unused keystream is self._keystream[self._keystream_pos:]
+        self._keystream = bytearray()
+        self._keystream_pos = 0
 
     def _get_keystream_bytes(self, nbytes):
-        while len(self._keystream) < nbytes:
+        pos = self._keystream_pos
+        if len(self._keystream) - pos < nbytes:
+            del self._keystream[:pos]
+            pos = 0
+            nblocks = max(KEYSTREAM_BATCH, (nbytes - len(self._keystream) + 63) // 64)
             nonce = ((0).to_bytes(4, 'little') + (self._chunk_counter // self._rekey_interval).to_bytes(8, 'little'))
-            self._keystream += chacha20_block(self._key, nonce, self._block_counter)
-            self._block_counter += 1
-        ret = self._keystream[:nbytes]
-        self._keystream = self._keystream[nbytes:]
-        return ret
+            self._keystream += chacha20_keystream(self._key, nonce, self._block_counter, nblocks)
+            self._block_counter += nblocks
+        self._keystream_pos = pos + nbytes
+        return bytes(self._keystream[pos:pos + nbytes])
 
     def crypt(self, chunk):
-        ks = self._get_keystream_bytes(len(chunk))
-        ret = bytes([ks[i] ^ chunk[i] for i in range(len(chunk))])
+        ret = xor_bytes(self._get_keystream_bytes(len(chunk)), chunk)
         if ((self._chunk_counter + 1) % self._rekey_interval) == 0:
             self._key = self._get_keystream_bytes(32)
             self._block_counter = 0
-            self._keystream = b''
+            self._keystream.clear()
+            self._keystream_pos = 0
         self._chunk_counter += 1
         return ret
 
@@ -160,3 +187,23 @@ class TestFrameworkChacha(unittest.TestCase):
 
             ciphertext = fsc20.crypt(plaintext)
             self.assertEqual(hex_ciphertext_after_rotation, ciphertext.hex())
+
+    def test_fschacha20_chunking(self):
+        """FSChaCha20 output does not depend on how the keystream is batched."""
+        key = bytes(range(32))
+        rng = random.Random(0)
+        chunks = [rng.randbytes(rng.choice([0, 1, 3, 31, 64, 65, 200, 1500])) for _ in range(40)]
+        fsc20 = FSChaCha20(key, 7)
+        # Straight from the block function: a fresh block counter and keystream per rekey
+        keystream, counter = b'', 0
+        for i, chunk in enumerate(chunks):
+            nonce = (0).to_bytes(4, 'little') + (i // 7).to_bytes(8, 'little')
+            needed = len(chunk) + (32 if (i + 1) % 7 == 0 else 0)
+            while len(keystream) < needed:
+                keystream += chacha20_block_python(key, nonce, counter)
+                counter += 1
+            expected = bytes(a ^ b for a, b in zip(keystream, chunk))
+            self.assertEqual(fsc20.crypt(chunk), expected)
+            keystream = keystream[len(chunk):]
+            if (i + 1) % 7 == 0:
+                key, keystream, counter = keystream[:32], b'', 0
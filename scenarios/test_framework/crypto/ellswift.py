@@ -12,6 +12,7 @@ import os
 import random
 import unittest
 
+from test_framework.crypto import native
 from test_framework.crypto.secp256k1 import FE, G, GE
 
 # Precomputed constant square root of -3 (mod p).
@@ -77,16 +78,29 @@ def xelligatorswift(x):
 def ellswift_create():
     """Generate a (privkey, ellswift_pubkey) pair."""
     priv = random.randrange(1, GE.ORDER)
-    u, t = xelligatorswift((priv * G).x)
+    if native.secp256k1_pubkey_x:
+        x = FE.from_bytes(native.secp256k1_pubkey_x(priv.to_bytes(32, 'big')))
+    else:
+        x = (priv * G).x
+    u, t = xelligatorswift(x)
     return priv.to_bytes(32, 'big'), u.to_bytes() + t.to_bytes()
 
-def ellswift_ecdh_xonly(pubkey_theirs, privkey):
+def ellswift_ecdh_xonly_python(pubkey_theirs, privkey):
     """Compute X coordinate of shared ECDH point between ellswift pubkey and privkey."""
     u = FE(int.from_bytes(pubkey_theirs[:32], 'big'))
     t = FE(int.from_bytes(pubkey_theirs[32:], 'big'))
     d = int.from_bytes(privkey, 'big')
     return (d * GE.lift_x(xswiftec(u, t))).x.to_bytes()
 
+def ellswift_ecdh_xonly(pubkey_theirs, privkey):
+    """Compute X coordinate of shared ECDH point between ellswift pubkey and privkey."""
+    if not native.secp256k1_ecdh_x:
+        return ellswift_ecdh_xonly_python(pubkey_theirs, privkey)
+    # Decoding the encoding is cheap, the multiplication is what libsecp256k1 speeds up
+    u = FE(int.from_bytes(pubkey_theirs[:32], 'big'))
+    t = FE(int.from_bytes(pubkey_theirs[32:], 'big'))
+    return native.secp256k1_ecdh_x(xswiftec(u, t).to_bytes(), privkey)
+
 
 class TestFrameworkEllSwift(unittest.TestCase):
     def test_xswiftec(self):
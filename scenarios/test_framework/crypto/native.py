@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+
+"""Optional native backends for the test framework crypto primitives.
+
+Each name below has the same signature as a pure Python implementation in this
+package and is None when no installed library provides it, in which case the
+pure Python code is used:
+
+- ripemd160: hashlib, when the linked OpenSSL still ships RIPEMD-160
+- chacha20_block, chacha20_keystream, Poly1305,
+  aead_chacha20_poly1305_encrypt/encrypt_into/decrypt: cryptography
+- secp256k1_pubkey_x, secp256k1_ecdh_x: coincurve
+
+Only primitives whose output is fully determined by their inputs are replaced.
+Signing and verification stay in pure Python, tests rely on them accepting and
+producing encodings libsecp256k1 refuses.
+
+Set TEST_FRAMEWORK_PURE_CRYPTO=1 in the environment to disable all of them.
+"""
+
+import hashlib
+import os
+import random
+import unittest
+
+ripemd160 = None
+chacha20_block = None
+chacha20_keystream = None
+Poly1305 = None
+aead_chacha20_poly1305_encrypt = None
+aead_chacha20_poly1305_encrypt_into = None
+aead_chacha20_poly1305_decrypt = None
+secp256k1_pubkey_x = None
+secp256k1_ecdh_x = None
+
+if not os.environ.get("TEST_FRAMEWORK_PURE_CRYPTO"):
+    try:
+        # OpenSSL 3 moved RIPEMD-160 to the legacy provider, which may not be loaded
+        hashlib.new("ripemd160", b"")
+    except ValueError:
+        pass
+    else:
+        def ripemd160(data):
+            """Compute the RIPEMD-160 hash of data."""
+            return hashlib.new("ripemd160", data).digest()
+
+    try:
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives import poly1305 as _poly1305
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+        from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+        ChaCha20Poly1305(bytes(32)).encrypt(bytes(12), b"", b"")
+        _poly1305.Poly1305.generate_tag(bytes(32), b"")
+    except Exception:
+        pass
+    else:
+        def chacha20_keystream(key, nonce, cnt, nblocks):
+            """Return nblocks consecutive ChaCha20 blocks, starting at block counter cnt."""
+            # cryptography takes the 32-bit block counter as the first 4 bytes of the nonce
+            algorithm = algorithms.ChaCha20(bytes(key), cnt.to_bytes(4, 'little') + bytes(nonce))
+            return Cipher(algorithm, None).encryptor().update(bytes(64 * nblocks))
+
+        def chacha20_block(key, nonce, cnt):
+            """Compute the 64-byte output of the ChaCha20 block function."""
+            return chacha20_keystream(key, nonce, cnt, 1)
+
+        class Poly1305:
+            """Class representing a running poly1305 computation."""
+            def __init__(self, key):
+                self.key = bytes(key)
+
+            def tag(self, data):
+                """Compute the poly1305 tag."""
+                return _poly1305.Poly1305.generate_tag(self.key, data)
+
+        def aead_chacha20_poly1305_encrypt(key, nonce, aad, plaintext):
+            """Encrypt a plaintext using ChaCha20Poly1305."""
+            if plaintext is None:
+                return None
+            return ChaCha20Poly1305(bytes(key)).encrypt(bytes(nonce), plaintext, aad)
+
+        def aead_chacha20_poly1305_encrypt_into(key, nonce, aad, plaintext, out):
+            """Encrypt a plaintext using ChaCha20Poly1305 into the start of the writable buffer out.
+
+            Returns the number of bytes written, len(plaintext) + 16."""
+            size = len(plaintext) + 16
+            cipher = ChaCha20Poly1305(bytes(key))
+            if hasattr(cipher, "encrypt_into"):
+                cipher.encrypt_into(bytes(nonce), plaintext, aad, memoryview(out)[:size])
+            else:
+                out[:size] = cipher.encrypt(bytes(nonce), plaintext, aad)
+            return size
+
+        def aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext):
+            """Decrypt a ChaCha20Poly1305 ciphertext."""
+            if ciphertext is None or len(ciphertext) < 16:
+                return None
+            try:
+                return ChaCha20Poly1305(bytes(key)).decrypt(bytes(nonce), ciphertext, aad)
+            except InvalidTag:
+                return None
+
+    try:
+        import coincurve
+    except ImportError:
+        pass
+    else:
+        def secp256k1_pubkey_x(privkey):
+            """Return the 32-byte X coordinate of privkey * G."""
+            return coincurve.PublicKey.from_valid_secret(bytes(privkey)).format()[1:]
+
+        def secp256k1_ecdh_x(x, privkey):
+            """Return the 32-byte X coordinate of privkey times the point with X coordinate x.
+
+            Only the X coordinate of the product is returned, so either lift of x
+            gives the same result."""
+            point = coincurve.PublicKey(b"\x02" + bytes(x))
+            return point.multiply(bytes(privkey)).format()[1:]
+
+
+def backends():
+    """Return a dict of primitive name -> "native" or "python" for logging."""
+    return {
+        "ripemd160": "native" if ripemd160 else "python",
+        "chacha20": "native" if chacha20_block else "python",
+        "poly1305": "native" if Poly1305 else "python",
+        "chacha20poly1305": "native" if aead_chacha20_poly1305_encrypt else "python",
+        "secp256k1_ecdh": "native" if secp256k1_ecdh_x else "python",
+    }
+
+
+class TestFrameworkNativeCrypto(unittest.TestCase):
+    """Check every native backend against the pure Python code on the in-tree test vectors."""
+
+    def test_ripemd160(self):
+        if ripemd160 is None:
+            self.skipTest("no native RIPEMD-160")
+        from .ripemd160 import ripemd160_python
+        for msg in [b"", b"a", b"abc", b"message digest", b"1234567890" * 8, bytes(range(256)) * 3]:
+            self.assertEqual(ripemd160(msg), ripemd160_python(msg))
+
+    def test_chacha20(self):
+        if chacha20_block is None:
+            self.skipTest("no native ChaCha20")
+        from .chacha20 import CHACHA20_TESTS, chacha20_block_python, chacha20_keystream_python
+        for hex_key, nonce, counter, hex_output in CHACHA20_TESTS:
+            key = bytes.fromhex(hex_key)
+            nonce_bytes = nonce[0].to_bytes(4, 'little') + nonce[1].to_bytes(8, 'little')
+            self.assertEqual(chacha20_block(key, nonce_bytes, counter).hex(), hex_output)
+            self.assertEqual(chacha20_block_python(key, nonce_bytes, counter).hex(), hex_output)
+            self.assertEqual(chacha20_keystream(key, nonce_bytes, counter, 5),
+                             chacha20_keystream_python(key, nonce_bytes, counter, 5))
+
+    def test_poly1305(self):
+        if Poly1305 is None:
+            self.skipTest("no native Poly1305")
+        from .poly1305 import POLY1305_TESTS, Poly1305Python
+        for hex_message, hex_key, hex_tag in POLY1305_TESTS:
+            message = bytes.fromhex(hex_message)
+            key = bytes.fromhex(hex_key)
+            self.assertEqual(Poly1305(key).tag(message).hex(), hex_tag)
+            self.assertEqual(Poly1305Python(key).tag(message).hex(), hex_tag)
+
+    def test_aead(self):
+        if aead_chacha20_poly1305_encrypt is None:
+            self.skipTest("no native ChaCha20Poly1305")
+        from .bip324_cipher import (
+            AEAD_TESTS,
+            aead_chacha20_poly1305_decrypt_python,
+            aead_chacha20_poly1305_encrypt_into_python,
+            aead_chacha20_poly1305_encrypt_python,
+        )
+        for hex_plain, hex_aad, hex_key, nonce, hex_cipher in AEAD_TESTS:
+            plain = bytes.fromhex(hex_plain)
+            aad = bytes.fromhex(hex_aad)
+            key = bytes.fromhex(hex_key)
+            nonce = nonce[0].to_bytes(4, 'little') + nonce[1].to_bytes(8, 'little')
+            ciphertext = aead_chacha20_poly1305_encrypt(key, nonce, aad, plain)
+            self.assertEqual(ciphertext.hex(), hex_cipher)
+            self.assertEqual(aead_chacha20_poly1305_encrypt_python(key, nonce, aad, plain), ciphertext)
+            for encrypt_into in (aead_chacha20_poly1305_encrypt_into, aead_chacha20_poly1305_encrypt_into_python):
+                out = bytearray(len(ciphertext) + 2)
+                self.assertEqual(encrypt_into(key, nonce, aad, plain, memoryview(out)[1:]), len(ciphertext))
+                self.assertEqual(out, b"\x00" + ciphertext + b"\x00")
+            self.assertEqual(aead_chacha20_poly1305_decrypt(key, nonce, aad, ciphertext), plain)
+            self.assertEqual(aead_chacha20_poly1305_decrypt_python(key, nonce, aad, ciphertext), plain)
+            # Both reject a corrupted tag the same way
+            forged = ciphertext[:-1] + bytes([ciphertext[-1] ^ 1])
+            self.assertIsNone(aead_chacha20_poly1305_decrypt(key, nonce, aad, forged))
+            self.assertIsNone(aead_chacha20_poly1305_decrypt_python(key, nonce, aad, forged))
+        self.assertIsNone(aead_chacha20_poly1305_encrypt(bytes(32), bytes(12), b"", None))
+        self.assertIsNone(aead_chacha20_poly1305_decrypt(bytes(32), bytes(12), b"", bytes(15)))
+
+    def test_secp256k1_ecdh(self):
+        if secp256k1_ecdh_x is None:
+            self.skipTest("no native secp256k1")
+        from .ellswift import ellswift_create, ellswift_ecdh_xonly_python
+        from .secp256k1 import G, GE
+        for _ in range(8):
+            priv = random.randrange(1, GE.ORDER).to_bytes(32, 'big')
+            self.assertEqual(secp256k1_pubkey_x(priv), (int.from_bytes(priv, 'big') * G).x.to_bytes())
+            privkey, encoding = ellswift_create()
+            self.assertEqual(secp256k1_ecdh_x(secp256k1_pubkey_x(privkey), priv),
+                             ellswift_ecdh_xonly_python(encoding, priv))
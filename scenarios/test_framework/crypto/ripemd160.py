@@ -5,6 +5,8 @@
 
 import unittest
 
+from . import native
+
 # Message schedule indexes for the left path.
 ML = [
     0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
@@ -92,7 +94,7 @@ def compress(h0, h1, h2, h3, h4, block):
     return h1 + cl + dr, h2 + dl + er, h3 + el + ar, h4 + al + br, h0 + bl + cr
 
 
-def ripemd160(data):
+def ripemd160_python(data):
     """Compute the RIPEMD-160 hash of data."""
     # Initialize state.
     state = (0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476, 0xc3d2e1f0)
@@ -109,6 +111,9 @@ def ripemd160(data):
     return b"".join((h & 0xffffffff).to_bytes(4, 'little') for h in state)
 
 
+ripemd160 = native.ripemd160 or ripemd160_python
+
+
 class TestFrameworkKey(unittest.TestCase):
     def test_ripemd160(self):
         """RIPEMD-160 test vectors."""
@@ -13,6 +13,9 @@ Exports:
 * FE: class for secp256k1 field elements
 * GE: class for secp256k1 group elements
 * G: the secp256k1 generator point
+
+Scalar multiplications run on Jacobian coordinates (X, Y, Z) over plain integers,
+representing the affine point (X/Z^2, Y/Z^3), and only convert back to a GE at the end.
 """
 
 import unittest
@@ -151,6 +154,140 @@ class FE:
         return f"FE(0x{int(self):x})"
 
 
+# Jacobian coordinate helpers. Points are (X, Y, Z) integer tuples modulo FE.SIZE,
+# with Z == 0 for infinity. Formulas for a = 0 curves from
+# https://hyperelliptic.org/EFD/g1p/auto-shortw-jacobian-0.html
+
+JAC_INFINITY = (0, 1, 0)
+
+
+def jac_double(p1):
+    """Double a Jacobian point (dbl-2009-l)."""
+    X1, Y1, Z1 = p1
+    if Z1 == 0 or Y1 == 0:
+        return JAC_INFINITY
+    P = FE.SIZE
+    A = X1 * X1 % P
+    B = Y1 * Y1 % P
+    C = B * B % P
+    D = 2 * ((X1 + B) * (X1 + B) - A - C) % P
+    E = 3 * A % P
+    X3 = (E * E - 2 * D) % P
+    Y3 = (E * (D - X3) - 8 * C) % P
+    Z3 = 2 * Y1 * Z1 % P
+    return (X3, Y3, Z3)
+
+
+def jac_add_affine(p1, x2, y2):
+    """Add the affine point (x2, y2) to a Jacobian point (madd-2007-bl)."""
+    X1, Y1, Z1 = p1
+    if Z1 == 0:
+        return (x2, y2, 1)
+    P = FE.SIZE
+    Z1Z1 = Z1 * Z1 % P
+    H = (x2 * Z1Z1 - X1) % P
+    r = 2 * (y2 * Z1 * Z1Z1 - Y1) % P
+    if H == 0:
+        if r == 0:
+            return jac_double(p1)
+        return JAC_INFINITY
+    HH = H * H % P
+    I = 4 * HH % P
+    J = H * I % P
+    V = X1 * I % P
+    X3 = (r * r - J - 2 * V) % P
+    Y3 = (r * (V - X3) - 2 * Y1 * J) % P
+    Z3 = ((Z1 + H) * (Z1 + H) - Z1Z1 - HH) % P
+    return (X3, Y3, Z3)
+
+
+def jac_add(p1, p2):
+    """Add two Jacobian points (add-2007-bl)."""
+    X1, Y1, Z1 = p1
+    X2, Y2, Z2 = p2
+    if Z1 == 0:
+        return p2
+    if Z2 == 0:
+        return p1
+    P = FE.SIZE
+    Z1Z1 = Z1 * Z1 % P
+    Z2Z2 = Z2 * Z2 % P
+    U1 = X1 * Z2Z2 % P
+    S1 = Y1 * Z2 * Z2Z2 % P
+    H = (X2 * Z1Z1 - U1) % P
+    r = 2 * (Y2 * Z1 * Z1Z1 - S1) % P
+    if H == 0:
+        if r == 0:
+            return jac_double(p1)
+        return JAC_INFINITY
+    I = 4 * H * H % P
+    J = H * I % P
+    V = U1 * I % P
+    X3 = (r * r - J - 2 * V) % P
+    Y3 = (r * (V - X3) - 2 * S1 * J) % P
+    Z3 = ((Z1 + Z2) * (Z1 + Z2) - Z1Z1 - Z2Z2) * H % P
+    return (X3, Y3, Z3)
+
+
+def jac_to_affine(p1):
+    """Convert a non-infinite Jacobian point to affine (x, y) integers."""
+    X1, Y1, Z1 = p1
+    P = FE.SIZE
+    zi = pow(Z1, -1, P)
+    zi2 = zi * zi % P
+    return (X1 * zi2 % P, Y1 * zi2 * zi % P)
+
+
+def jac_to_affine_batch(points):
+    """Convert a list of non-infinite Jacobian points to affine with a single inversion."""
+    P = FE.SIZE
+    # prefix[i] = Z_0 * ... * Z_(i-1)
+    prefix = [1]
+    for _, _, Z in points:
+        prefix.append(prefix[-1] * Z % P)
+    inv = pow(prefix[-1], -1, P)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        zi = inv * prefix[i] % P
+        inv = inv * Z % P
+        zi2 = zi * zi % P
+        result[i] = (X * zi2 % P, Y * zi2 * zi % P)
+    return result
+
+
+def odd_multiples(p1, count):
+    """Return [P, 3P, 5P, ...] (count points) in affine for an affine (x, y) point P."""
+    twice = jac_double((p1[0], p1[1], 1))
+    points = [(p1[0], p1[1], 1)]
+    for _ in range(count - 1):
+        points.append(jac_add(points[-1], twice))
+    return jac_to_affine_batch(points)
+
+
+def wnaf(a, w):
+    """Return the width-w non-adjacent form of a non-negative integer, least significant
+    digit first. Every non-zero digit is odd, below 2^(w-1) in absolute value, and
+    followed by at least w-1 zeros."""
+    digits = []
+    while a:
+        if a & 1:
+            d = a & ((1 << w) - 1)
+            if d >= 1 << (w - 1):
+                d -= 1 << w
+            a -= d
+        else:
+            d = 0
+        digits.append(d)
+        a >>= 1
+    return digits
+
+
+# wNAF window for points only used once, and for G, whose odd multiples are cached
+WINDOW_A = 5
+WINDOW_G = 8
+
+
 class GE:
     """Objects of this class represent secp256k1 group elements (curve points or infinity)
 
@@ -184,6 +321,26 @@ class GE:
             self.x = fx
             self.y = fy
 
+    @staticmethod
+    def _unchecked(x, y):
+        """Construct a point known to be on the curve, skipping the curve equation check."""
+        r = GE.__new__(GE)
+        r.infinity = False
+        r.x = x if isinstance(x, FE) else FE(x)
+        r.y = y if isinstance(y, FE) else FE(y)
+        return r
+
+    @staticmethod
+    def from_jacobian(p1):
+        """Convert a Jacobian point computed from valid points to a group element."""
+        if p1[2] == 0:
+            return GE()
+        return GE._unchecked(*jac_to_affine(p1))
+
+    def to_affine_ints(self):
+        """Return (x, y) as integers, for a non-infinite group element."""
+        return (int(self.x), int(self.y))
+
     def __add__(self, a):
         """Add two group elements together."""
         # Deal with infinity: a + infinity == infinity + a == a.
@@ -205,27 +362,45 @@ class GE:
         # Determine point opposite to the intersection of that line with the curve.
         x = lam**2 - (self.x + a.x)
         y = lam * (self.x - x) - self.y
-        return GE(x, y)
+        return GE._unchecked(x, y)
 
     @staticmethod
     def mul(*aps):
         """Compute a (batch) scalar group element multiplication.
 
         GE.mul((a1, p1), (a2, p2), (a3, p3)) is identical to a1*p1 + a2*p2 + a3*p3,
-        but more efficient."""
-        # Reduce all the scalars modulo order first (so we can deal with negatives etc).
-        naps = [(a % GE.ORDER, p) for a, p in aps]
+        but more efficient.
+
+        Each scalar is written in wNAF, each point gets a table of its odd multiples
+        (cached for G), and all of them share one chain of doublings (Strauss)."""
+        terms = []
+        for a, p in aps:
+            # Reduce all the scalars modulo order first (so we can deal with negatives etc).
+            a = a % GE.ORDER
+            if a == 0 or p.infinity:
+                continue
+            if p is G:
+                terms.append((wnaf(a, WINDOW_G), FAST_G.odd_multiples))
+            else:
+                terms.append((wnaf(a, WINDOW_A), odd_multiples(p.to_affine_ints(), 1 << (WINDOW_A - 2))))
+        P = FE.SIZE
         # Start with point at infinity.
-        r = GE()
-        # Iterate over all bit positions, from high to low.
-        for i in range(255, -1, -1):
+        r = JAC_INFINITY
+        # Iterate over all digit positions, from high to low.
+        for i in range(max((len(digits) for digits, _ in terms), default=0) - 1, -1, -1):
             # Double what we have so far.
-            r = r + r
-            # Add then add the points for which the corresponding scalar bit is set.
-            for (a, p) in naps:
-                if (a >> i) & 1:
-                    r += p
-        return r
+            r = jac_double(r)
+            # Add or subtract the odd multiple for every non-zero digit.
+            for digits, table in terms:
+                if i < len(digits) and digits[i]:
+                    d = digits[i]
+                    if d > 0:
+                        x, y = table[d >> 1]
+                        r = jac_add_affine(r, x, y)
+                    else:
+                        x, y = table[-d >> 1]
+                        r = jac_add_affine(r, x, P - y)
+        return GE.from_jacobian(r)
 
     def __rmul__(self, a):
         """Multiply an integer with a group element."""
@@ -237,7 +412,7 @@ class GE:
         """Compute the negation of a group element."""
         if self.infinity:
             return self
-        return GE(self.x, -self.y)
+        return GE._unchecked(self.x, -self.y)
 
     def to_bytes_compressed(self):
         """Convert a non-infinite group element to 33-byte compressed encoding."""
@@ -262,7 +437,7 @@ class GE:
             return None
         if not y.is_even():
             y = -y
-        return GE(x, y)
+        return GE._unchecked(FE(x), y)
 
     @staticmethod
     def from_bytes(b):
@@ -287,7 +462,7 @@ class GE:
             y = FE.from_bytes(b[33:])
             if y**2 != x**3 + 7:
                 return None
-            return GE(x, y)
+            return GE._unchecked(x, y)
 
     @staticmethod
     def from_bytes_xonly(b):
@@ -322,28 +497,59 @@ G = GE.lift_x(0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
 class FastGEMul:
     """Table for fast multiplication with a constant group element.
 
-    Speed up scalar multiplication with a fixed point P by using a precomputed lookup table with
-    its powers of 2:
+    Speed up scalar multiplication with a fixed point P by using a precomputed lookup table
+    with, for every window of `window` scalar bits, all multiples that window can contribute:
 
-        table = [P, 2*P, 4*P, (2^3)*P, (2^4)*P, ..., (2^255)*P]
+        table[i][d - 1] = d * 2^(window*i) * P    for d in 1 .. 2^window - 1
 
-    During multiplication, the points corresponding to each bit set in the scalar are added up,
-    i.e. on average ~128 point additions take place.
+    During multiplication one table point is added per non-zero window, i.e. at most
+    ceil(256 / window) point additions and no doublings take place. Both the table and the
+    odd multiples of P used by GE.mul are only built on first use.
     """
 
-    def __init__(self, p):
-        self.table = [p]  # table[i] = (2^i) * p
-        for _ in range(255):
-            p = p + p
-            self.table.append(p)
+    def __init__(self, p, window=8):
+        self.p = p
+        self.window = window
+        self._table = None
+        self._odd_multiples = None
+
+    @property
+    def table(self):
+        if self._table is None:
+            w = self.window
+            points = []
+            base = (int(self.p.x), int(self.p.y), 1)
+            for _ in range((256 + w - 1) // w):
+                multiple = base
+                for _ in range((1 << w) - 1):
+                    points.append(multiple)
+                    multiple = jac_add(multiple, base)
+                # multiple is now 2^w * base
+                base = multiple
+            affine = jac_to_affine_batch(points)
+            size = (1 << w) - 1
+            self._table = [affine[i:i + size] for i in range(0, len(affine), size)]
+        return self._table
+
+    @property
+    def odd_multiples(self):
+        if self._odd_multiples is None:
+            self._odd_multiples = odd_multiples(self.p.to_affine_ints(), 1 << (WINDOW_G - 2))
+        return self._odd_multiples
 
     def mul(self, a):
-        result = GE()
+        result = JAC_INFINITY
         a = a % GE.ORDER
-        for bit in range(a.bit_length()):
-            if a & (1 << bit):
-                result += self.table[bit]
-        return result
+        w = self.window
+        mask = (1 << w) - 1
+        for window in self.table:
+            if a == 0:
+                break
+            d = a & mask
+            if d:
+                result = jac_add_affine(result, *window[d - 1])
+            a >>= w
+        return GE.from_jacobian(result)
 
 # Precomputed table with multiples of G for fast multiplication
 FAST_G = FastGEMul(G)
@@ -353,3 +559,42 @@ class TestFrameworkSecp256k1(unittest.TestCase):
         H = sha256(G.to_bytes_uncompressed()).digest()
         assert GE.lift_x(FE.from_bytes(H)) is not None
         self.assertEqual(H.hex(), "50929b74c1a04954b78b4b6035e97a5e078a5a0f28ec96d547bfee9ace803ac0")
+
+    def test_jacobian(self):
+        def affine_mul(a, p):
+            r = GE()
+            for i in range(a.bit_length() - 1, -1, -1):
+                r = r + r
+                if (a >> i) & 1:
+                    r = r + p
+            return r
+
+        P = GE.lift_x(FE(0x50929b74c1a04954b78b4b6035e97a5e078a5a0f28ec96d547bfee9ace803ac0))
+        for a, b in [(1, 0), (0, 1), (2, 3), (GE.ORDER - 1, 5), (0xdeadbeef ** 5, 0xfeedface ** 7)]:
+            expected = affine_mul(a % GE.ORDER, G) + affine_mul(b % GE.ORDER, P)
+            for result in (GE.mul((a, G), (b, P)), a * G + b * P):
+                self.assertEqual(result.infinity, expected.infinity)
+                if not expected.infinity:
+                    self.assertEqual(result.to_bytes_uncompressed(), expected.to_bytes_uncompressed())
+        # P + -P and doubling through the Jacobian formulas
+        self.assertTrue(GE.mul((1, P), (1, -P)).infinity)
+        self.assertTrue(GE.mul((3, G), (-3, G)).infinity)
+        self.assertEqual(GE.mul((1, P), (1, P)).to_bytes_compressed(), (P + P).to_bytes_compressed())
+        self.assertTrue((GE.ORDER * G).infinity)
+        self.assertTrue(GE.mul((5, GE())).infinity)
+
+    def test_wnaf_and_tables(self):
+        for a in (1, 7, 0xff, GE.ORDER - 1, 0xdeadbeef ** 7 % GE.ORDER):
+            for w in (2, 5, 8):
+                digits = wnaf(a, w)
+                self.assertEqual(sum(d << i for i, d in enumerate(digits)), a)
+                nonzero = [i for i, d in enumerate(digits) if d]
+                self.assertTrue(all(digits[i] % 2 and abs(digits[i]) < 1 << (w - 1) for i in nonzero))
+                self.assertTrue(all(j - i >= w for i, j in zip(nonzero, nonzero[1:])))
+        P = GE.lift_x(FE(0x50929b74c1a04954b78b4b6035e97a5e078a5a0f28ec96d547bfee9ace803ac0))
+        for window in (1, 4, 7):
+            fast = FastGEMul(P, window)
+            for a in (1, 2, 0xff, GE.ORDER - 1, 0xdeadbeef ** 7):
+                self.assertEqual(fast.mul(a).to_bytes_compressed(), GE.mul((a, P)).to_bytes_compressed())
+        # G goes through its cached odd multiples inside GE.mul
+        self.assertEqual(GE.mul((12345, G), (1, P)).to_bytes_compressed(), (12345 * G + P).to_bytes_compressed())
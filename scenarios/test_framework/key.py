@@ -6,6 +6,7 @@
 WARNING: This code is slow, uses bad randomness, does not properly protect
 keys, and is trivially vulnerable to side channel attacks. Do not use for
 anything but tests."""
+from concurrent.futures import ProcessPoolExecutor
 import csv
 import hashlib
 import hmac
@@ -264,6 +265,105 @@ def verify_schnorr(key, sig, msg):
         return False
     return True
 
+def _schnorr_batch_valid(entries):
+    """Check s_i*G == R_i + e_i*P_i for all (P, R, s, e, (key, sig, msg)) entries at once,
+    using a linear combination with the first coefficient fixed to 1 (see BIP 340).
+
+    The other coefficients are derived from a hash of every key, message and signature
+    in the batch, so they cannot be predicted without fixing the whole batch first."""
+    items = [item for *_, item in entries]
+    seed = TaggedHash("BIP0340/batch", b"".join(key for key, _, _ in items) +
+                      b"".join(len(msg).to_bytes(4, 'big') + msg for _, _, msg in items) +
+                      b"".join(sig for _, sig, _ in items))
+    terms = []
+    s_sum = 0
+    for i, (P, R, s, e, _) in enumerate(entries):
+        a = 1
+        if i:
+            a = int.from_bytes(TaggedHash("BIP0340/batch", seed + i.to_bytes(4, 'big')), 'big') % (ORDER - 1) + 1
+        s_sum += a * s
+        terms.append((-a, R))
+        terms.append((-a * e, P))
+    return secp256k1.GE.mul((s_sum, secp256k1.G), *terms).infinity
+
+def _schnorr_batch_results(entries, results):
+    """Batch check the entries, bisecting a failing batch to find the invalid ones."""
+    if _schnorr_batch_valid([entry for _, entry in entries]):
+        for index, _ in entries:
+            results[index] = True
+    elif len(entries) > 1:
+        half = len(entries) // 2
+        _schnorr_batch_results(entries[:half], results)
+        _schnorr_batch_results(entries[half:], results)
+
+def _map_chunks(func, items, processes):
+    """Run func over items in processes worker processes and join the per-item results."""
+    size = (len(items) + processes - 1) // processes
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return [result for chunk in pool.map(func, chunks) for result in chunk]
+
+def verify_schnorr_batch(items, processes=None):
+    """Verify many Schnorr signatures (see BIP 340) together.
+
+    - items is a list of (key, sig, msg) tuples as taken by verify_schnorr
+    - processes, if set, splits the items over that many worker processes
+
+    Returns a list with the verify_schnorr result for every item. All well-formed
+    signatures are checked with a single multi-scalar multiplication, and a failing
+    batch is bisected to find the invalid signatures.
+    """
+    items = list(items)
+    if processes and processes > 1 and len(items) > 1:
+        return _map_chunks(verify_schnorr_batch, items, processes)
+    results = [False] * len(items)
+    entries = []
+    for index, (key, sig, msg) in enumerate(items):
+        assert len(key) == 32
+        assert len(sig) == 64
+        P = secp256k1.GE.from_bytes_xonly(key)
+        if P is None:
+            continue
+        r = int.from_bytes(sig[0:32], 'big')
+        if r >= secp256k1.FE.SIZE:
+            continue
+        R = secp256k1.GE.lift_x(secp256k1.FE(r))
+        if R is None:
+            continue
+        s = int.from_bytes(sig[32:64], 'big')
+        if s >= ORDER:
+            continue
+        e = int.from_bytes(TaggedHash("BIP0340/challenge", sig[0:32] + key + msg), 'big') % ORDER
+        entries.append((index, (P, R, s, e, (key, sig, msg))))
+    if entries:
+        _schnorr_batch_results(entries, results)
+    return results
+
+def _verify_ecdsa_items(items):
+    results = []
+    for pubkey, sig, msg, low_s in items:
+        key = ECPubKey()
+        key.set(pubkey)
+        results.append(key.is_valid and key.verify_ecdsa(sig, msg, low_s))
+    return results
+
+def verify_ecdsa_many(items, low_s=True, processes=None):
+    """Verify many ECDSA signatures.
+
+    - items is a list of (pubkey, sig, msg) tuples, where pubkey is an ECPubKey or its
+      serialization, and sig and msg are as taken by ECPubKey.verify_ecdsa
+    - processes, if set, splits the items over that many worker processes
+
+    Returns a list with the verify_ecdsa result for every item. ECDSA signatures don't
+    commit to the full nonce point, so unlike Schnorr signatures they can't be checked
+    as one linear combination; the speedup comes from the worker processes.
+    """
+    items = [(pubkey.get_bytes() if isinstance(pubkey, ECPubKey) else pubkey, sig, msg, low_s)
+             for pubkey, sig, msg in items]
+    if processes and processes > 1 and len(items) > 1:
+        return _map_chunks(_verify_ecdsa_items, items, processes)
+    return _verify_ecdsa_items(items)
+
 def sign_schnorr(key, msg, aux=None, flip_p=False, flip_r=False):
     """Create a Schnorr signature (see BIP 340)."""
 
@@ -312,6 +412,35 @@ class TestFrameworkKey(unittest.TestCase):
                     self.assertFalse(verify_pubkey.verify_ecdsa(sig_ecdsa, msg))
                     self.assertFalse(verify_schnorr(verify_xonly_pubkey, sig_schnorr, msg))
 
+    def test_batch_verification(self):
+        keys = [generate_privkey() for _ in range(6)]
+        msgs = [bytes([i]) * 32 for i in range(6)]
+        schnorr_items = [(compute_xonly_pubkey(k)[0], sign_schnorr(k, m), m) for k, m in zip(keys, msgs)]
+        ecdsa_items = []
+        for k, m in zip(keys, msgs):
+            key = ECKey()
+            key.set(k, compressed=True)
+            ecdsa_items.append((key.get_pubkey(), key.sign_ecdsa(m), m))
+        # break a couple of them, including a malformed signature
+        schnorr_items[1] = (schnorr_items[1][0], random_bitflip(schnorr_items[1][1]), schnorr_items[1][2])
+        schnorr_items[4] = (schnorr_items[4][0], b"\xff" * 64, schnorr_items[4][2])
+        ecdsa_items[2] = (ecdsa_items[2][0], ecdsa_items[2][1], msgs[3])
+        expected_schnorr = [verify_schnorr(*item) for item in schnorr_items]
+        expected_ecdsa = [pubkey.verify_ecdsa(sig, msg) for pubkey, sig, msg in ecdsa_items]
+        self.assertEqual(expected_schnorr, [True, False, True, True, False, True])
+        self.assertEqual(expected_ecdsa, [True, True, False, True, True, True])
+        self.assertEqual(verify_schnorr_batch(schnorr_items), expected_schnorr)
+        self.assertEqual(verify_schnorr_batch(schnorr_items, processes=2), expected_schnorr)
+        self.assertEqual(verify_ecdsa_many(ecdsa_items), expected_ecdsa)
+        self.assertEqual(verify_ecdsa_many(ecdsa_items, processes=2), expected_ecdsa)
+        self.assertEqual(verify_schnorr_batch([]), [])
+        # two invalid signatures whose errors cancel out if summed without coefficients
+        (k0, sig0, m0), (k1, sig1, m1) = schnorr_items[0], schnorr_items[2]
+        s0, s1 = int.from_bytes(sig0[32:], 'big'), int.from_bytes(sig1[32:], 'big')
+        forged = [(k0, sig0[:32] + ((s0 + 1) % ORDER).to_bytes(32, 'big'), m0),
+                  (k1, sig1[:32] + ((s1 - 1) % ORDER).to_bytes(32, 'big'), m1)]
+        self.assertEqual(verify_schnorr_batch(forged), [False, False])
+
     def test_schnorr_testvectors(self):
         """Implement the BIP340 test vectors (read from bip340_test_vectors.csv)."""
         num_tests = 0
@@ -3,17 +3,25 @@
 # Distributed under the MIT software license, see the accompanying
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
 """Helpful routines for mempool testing."""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import logging
 import random
+import time
+import unittest
 
+from .authproxy import JSONRPCException
 from .blocktools import (
     COINBASE_MATURITY,
 )
 from .messages import (
+    COIN,
     COutPoint,
     CTransaction,
     CTxIn,
     CTxInWitness,
     CTxOut,
+    tx_from_hex,
 )
 from .script import (
     CScript,
@@ -22,11 +30,12 @@ from .script import (
 from .util import (
     assert_equal,
     assert_greater_than,
-    create_lots_of_big_transactions,
     gen_return_txouts,
 )
 from .wallet import (
     MiniWallet,
+    MiniWalletMode,
+    _batch_error,
 )
 
 # Default for -minrelaytxfee in sat/kvB
@@ -37,6 +46,9 @@ DEFAULT_INCREMENTAL_RELAY_FEE = 100
 TRUC_MAX_VSIZE = 10000
 TRUC_CHILD_MAX_VSIZE = 1000
 
+# Padded txs per sendrawtransaction batch, each one is ~135kB of hex
+FILL_BATCH_SIZE = 25
+
 def assert_mempool_contents(test_framework, node, expected=None, sync=True):
     """Assert that all transactions in expected are in the mempool,
     and no additional ones exist. 'expected' is an array of
@@ -85,10 +97,10 @@ def fill_mempool(test_framework, node, *, tx_sync_fun=None):
     tx_to_be_evicted_id = ephemeral_miniwallet.send_self_transfer(
         from_node=node, utxo_to_spend=confirmed_utxos.pop(0), fee_rate=minrelayfee)["txid"]
 
-    def send_batch(fee):
-        utxos = confirmed_utxos[:tx_batch_size]
-        create_lots_of_big_transactions(ephemeral_miniwallet, node, fee, tx_batch_size, txouts, utxos)
-        del confirmed_utxos[:tx_batch_size]
+    def send_batch(fees):
+        utxos = confirmed_utxos[:len(fees) * tx_batch_size]
+        del confirmed_utxos[:len(utxos)]
+        send_big_transactions(ephemeral_miniwallet, node, [fee for fee in fees for _ in range(tx_batch_size)], utxos, txouts)
 
     # Increase the tx fee rate to give the subsequent transactions a higher priority in the mempool
     # The tx has an approx. vsize of 65k, i.e. multiplying the previous fee rate (in sats/kvB)
@@ -97,12 +109,10 @@ def fill_mempool(test_framework, node, *, tx_sync_fun=None):
     batch_fees = [(i + 1) * base_fee for i in range(num_of_batches)]
 
     test_framework.log.debug("Fill up the mempool with txs with higher fee rate")
-    for fee in batch_fees[:-3]:
-        send_batch(fee)
+    send_batch(batch_fees[:-3])
     tx_sync_fun() if tx_sync_fun else test_framework.sync_mempools()  # sync before any eviction
     assert_equal(node.getmempoolinfo()["mempoolminfee"], minrelayfee)
-    for fee in batch_fees[-3:]:
-        send_batch(fee)
+    send_batch(batch_fees[-3:])
     tx_sync_fun() if tx_sync_fun else test_framework.sync_mempools()  # sync after all evictions
 
     test_framework.log.debug("The tx should be evicted by now")
@@ -115,6 +125,91 @@ def fill_mempool(test_framework, node, *, tx_sync_fun=None):
     assert_equal(node.getmempoolinfo()['minrelaytxfee'], minrelayfee)
     assert_greater_than(node.getmempoolinfo()['mempoolminfee'], minrelayfee)
 
+def fill_mempool_until(test_framework, node, mini_wallet, *, target_bytes=None, fee_floor=None, fee_rate=None, max_txs=10000, batch_size=FILL_BATCH_SIZE):
+    """Send padded txs with rising fees until the mempool holds target_bytes
+    or its mempoolminfee (BTC/kvB) reaches fee_floor, e.g. to add on-chain fee
+    pressure to a game. The txs spend confirmed utxos of mini_wallet, starting
+    at fee_rate (BTC/kvB, default the node's relay fee) and adding that much
+    again with every round.
+
+    Returns the number of txs sent, the time taken, the txs/sec and the final
+    getmempoolinfo.
+    """
+    assert target_bytes or fee_floor
+    txouts = gen_return_txouts()
+    fee_rate = fee_rate or node.getnetworkinfo()['relayfee']
+    # The padded txs are just under 68 kvB
+    base_fee = fee_rate * 68
+    round_size = 4 * batch_size
+
+    test_framework.log.info(f"Fill the mempool until {target_bytes or '-'} bytes or {fee_floor or '-'} BTC/kvB minimum fee")
+    start = time.perf_counter()
+    sent = 0
+    rounds = 0
+    while True:
+        info = node.getmempoolinfo()
+        if (target_bytes and info["bytes"] >= target_bytes) or (fee_floor and info["mempoolminfee"] >= fee_floor):
+            break
+        if sent >= max_txs:
+            test_framework.log.warning(f"Stopped filling the mempool after {sent} txs")
+            break
+        utxos = []
+        try:
+            for _ in range(min(round_size, max_txs - sent)):
+                utxos.append(mini_wallet.get_utxo(confirmed_only=True))
+        except StopIteration:
+            if not utxos:
+                test_framework.log.warning(f"Wallet ran out of confirmed utxos after {sent} txs")
+                break
+        rounds += 1
+        send_big_transactions(mini_wallet, node, [base_fee * rounds] * len(utxos), utxos, txouts, batch_size=batch_size)
+        sent += len(utxos)
+        elapsed = time.perf_counter() - start
+        test_framework.log.debug(f"Sent {sent} txs, {sent / elapsed:.1f} txs/s, mempool {info['bytes']} bytes")
+
+    elapsed = time.perf_counter() - start
+    result = {"txs": sent, "seconds": elapsed, "txs_per_sec": sent / elapsed if elapsed else 0.0, "mempool": info}
+    test_framework.log.info(f"Sent {sent} txs in {elapsed:.1f}s ({result['txs_per_sec']:.1f} txs/s), "
+                            f"mempool {info['bytes']} bytes, minimum fee {info['mempoolminfee']}")
+    return result
+
+def create_big_transaction(mini_wallet, utxo, fee, txouts):
+    """Spend utxo back to mini_wallet paying exactly fee, padded with the
+    shared txouts from gen_return_txouts()"""
+    tx = mini_wallet.create_self_transfer(utxo_to_spend=utxo, fee=fee)["tx"]
+    tx.vout.extend(txouts)
+    assert_equal(int(utxo['value'] * COIN) - sum(txout.nValue for txout in tx.vout), int(fee * COIN))
+    return tx
+
+def send_big_transactions(mini_wallet, node, fees, utxos, txouts, *, batch_size=FILL_BATCH_SIZE):
+    """Send a padded tx for each fee and utxo with batched sendrawtransaction
+    calls. Each batch is built while the previous one is in flight, with at
+    most one RPC at a time. Returns the txids."""
+    assert_equal(len(fees), len(utxos))
+    txids = []
+
+    def collect(requests, future):
+        # Matched by position, as with use_cli the responses carry no id
+        responses = future.result()
+        assert_equal(len(responses), len(requests))
+        for response in responses:
+            error = _batch_error(response)
+            if error:
+                raise JSONRPCException(error)
+            txids.append(response["result"])
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        in_flight = None
+        for i in range(0, len(fees), batch_size):
+            requests = [node.sendrawtransaction.get_request(create_big_transaction(mini_wallet, utxo, fee, txouts).serialize().hex())
+                        for fee, utxo in zip(fees[i:i + batch_size], utxos[i:i + batch_size])]
+            if in_flight:
+                collect(*in_flight)
+            in_flight = (requests, pool.submit(node.batch, requests))
+        if in_flight:
+            collect(*in_flight)
+    return txids
+
 def tx_in_orphanage(node, tx: CTransaction) -> bool:
     """Returns true if the transaction is in the orphanage."""
     found = [o for o in node.getorphantxs(verbosity=1) if o["txid"] == tx.txid_hex and o["wtxid"] == tx.wtxid_hex]
@@ -129,3 +224,106 @@ def create_large_orphan():
     tx.wit.vtxinwit[0].scriptWitness.stack = [CScript(b'X' * 390000)]
     tx.vout = [CTxOut(100, CScript([OP_RETURN, b'a' * 20]))]
     return tx
+
+
+class TestFrameworkMempoolUtil(unittest.TestCase):
+    class Node:
+        """Accepts every tx into a mempool whose minimum fee rises once it holds max_bytes"""
+        def __init__(self, *, num_utxos, cli=False, max_bytes=None):
+            self.cli = cli
+            self.num_utxos = num_utxos
+            self.max_bytes = max_bytes
+            self.reject = set()
+            self.batches = []
+            self.mempool = {}
+
+        class sendrawtransaction:
+            @staticmethod
+            def get_request(hexstring):
+                return {"id": hexstring[:16], "params": [hexstring]}
+
+        def scantxoutset(self, **kwargs):
+            return {"success": True, "height": 200, "unspents": [
+                {"txid": f"{i:064x}", "vout": 0, "amount": Decimal(50), "height": 1, "coinbase": False}
+                for i in range(1, self.num_utxos + 1)]}
+
+        def getrawmempool(self, verbose):
+            return {}
+
+        def getnetworkinfo(self):
+            return {"relayfee": Decimal("0.00001")}
+
+        def getmempoolinfo(self):
+            size = sum(len(hexstring) // 2 for hexstring in self.mempool.values())
+            full = self.max_bytes is not None and size >= self.max_bytes
+            return {"bytes": size, "mempoolminfee": Decimal("0.0001") if full else Decimal("0.00001")}
+
+        def batch(self, requests):
+            self.batches.append(len(requests))
+            responses = []
+            for i, request in enumerate(requests):
+                hexstring = request["params"][0]
+                if i in self.reject:
+                    error = {"code": -26, "message": "rejected"}
+                    responses.append({"error": JSONRPCException(error)} if self.cli else {"id": request["id"], "result": None, "error": error})
+                    continue
+                txid = tx_from_hex(hexstring).txid_hex
+                self.mempool[txid] = hexstring
+                # use_cli responses have no id
+                responses.append({"result": txid} if self.cli else {"id": request["id"], "result": txid, "error": None})
+            return responses
+
+    class Framework:
+        log = logging.getLogger("TestFramework.mempool_util")
+
+    @staticmethod
+    def fee(hexstring):
+        return Decimal(50) - Decimal(sum(txout.nValue for txout in tx_from_hex(hexstring).vout)) / COIN
+
+    def test_send_big_transactions(self):
+        txouts = gen_return_txouts()
+        for cli in (False, True):
+            node = self.Node(num_utxos=5, cli=cli)
+            wallet = MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE)
+            fees = [Decimal("0.001") * (i + 1) for i in range(5)]
+            utxos = [wallet.get_utxo() for _ in fees]
+            txids = send_big_transactions(wallet, node, fees, utxos, txouts, batch_size=2)
+            self.assertEqual(node.batches, [2, 2, 1])
+            self.assertEqual(txids, list(node.mempool))
+            self.assertEqual([self.fee(node.mempool[txid]) for txid in txids], fees)
+
+            node = self.Node(num_utxos=3, cli=cli)
+            node.reject = {1}
+            wallet = MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE)
+            with self.assertRaises(JSONRPCException):
+                send_big_transactions(wallet, node, [Decimal("0.001")] * 3, [wallet.get_utxo() for _ in range(3)], txouts)
+
+    def test_fill_mempool_until(self):
+        # stops at the target size, with every round paying more than the last
+        node = self.Node(num_utxos=20)
+        wallet = MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE)
+        result = fill_mempool_until(self.Framework, node, wallet, target_bytes=500000, batch_size=2)
+        self.assertEqual(result["txs"], 8)
+        self.assertGreaterEqual(result["mempool"]["bytes"], 500000)
+        self.assertGreater(result["txs_per_sec"], 0)
+        fees = [self.fee(hexstring) for hexstring in node.mempool.values()]
+        self.assertEqual(fees, [Decimal("0.00068")] * 8)
+        self.assertEqual(node.batches, [2, 2, 2, 2])
+
+        # stops once the minimum fee reaches the floor
+        node = self.Node(num_utxos=20, max_bytes=600000)
+        wallet = MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE)
+        result = fill_mempool_until(self.Framework, node, wallet, fee_floor=Decimal("0.0001"), batch_size=2)
+        self.assertEqual(result["txs"], 16)
+        fees = [self.fee(hexstring) for hexstring in node.mempool.values()]
+        self.assertEqual(fees, [Decimal("0.00068")] * 8 + [Decimal("0.00136")] * 8)
+
+        # and when it runs out of utxos or reaches max_txs
+        node = self.Node(num_utxos=3)
+        with self.assertLogs(self.Framework.log, "WARNING"):
+            result = fill_mempool_until(self.Framework, node, MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE), target_bytes=10**9)
+        self.assertEqual(result["txs"], 3)
+        node = self.Node(num_utxos=20)
+        with self.assertLogs(self.Framework.log, "WARNING"):
+            result = fill_mempool_until(self.Framework, node, MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE), target_bytes=10**9, max_txs=5)
+        self.assertEqual(result["txs"], 5)
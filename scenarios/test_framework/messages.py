@@ -14,6 +14,14 @@ msg_block, msg_tx, msg_headers, etc.:
     data structures that represent network messages
 
 ser_*, deser_*: functions that handle serialization/deserialization.
+    The *_into variants append to a caller-supplied bytearray instead of
+    returning new bytes, so nested objects share one output buffer.
+
+ByteReader: a cursor over a received buffer that the core primitives
+    deserialize from, used in place of BytesIO.
+
+LazyTransaction/LazyBlock: keep received transactions in their wire form
+    and only decode them when their fields are accessed.
 
 Classes use __slots__ to ensure extraneous attributes aren't accidentally added
 by tests, compromising their intended effect.
@@ -25,6 +33,7 @@ from io import BytesIO
 import math
 import random
 import socket
+import struct
 import time
 import unittest
 
@@ -90,6 +99,129 @@ MAGIC_BYTES = {
     "signet": b"\x0a\x03\xcf\x40",
 }
 
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_U64 = struct.Struct("<Q")
+_I64 = struct.Struct("<q")
+
+
+class ByteReader:
+    """Read position in a bytes-like object.
+
+    Supports the read()/tell()/seek() subset of BytesIO that deserialize
+    methods use, plus typed reads that unpack straight from the buffer
+    without creating an intermediate bytes object per field. read() returns
+    bytes, read_bytes() returns a memoryview slice without copying."""
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, data, pos=0):
+        self.buf = memoryview(data)
+        self.pos = pos
+
+    def read(self, n=-1):
+        start = self.pos
+        end = len(self.buf) if n is None or n < 0 else min(start + n, len(self.buf))
+        self.pos = end
+        return self.buf[start:end].tobytes()
+
+    def read_bytes(self, n):
+        start = self.pos
+        if start + n > len(self.buf):
+            raise ValueError(f"read of {n} bytes past end of buffer")
+        self.pos = start + n
+        return self.buf[start:start + n]
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def remaining(self):
+        return len(self.buf) - self.pos
+
+    def read_u8(self):
+        pos = self.pos
+        self.pos = pos + 1
+        return self.buf[pos]
+
+    def read_u16(self):
+        pos = self.pos
+        self.pos = pos + 2
+        return _U16.unpack_from(self.buf, pos)[0]
+
+    def read_u32(self):
+        pos = self.pos
+        self.pos = pos + 4
+        return _U32.unpack_from(self.buf, pos)[0]
+
+    def read_i32(self):
+        pos = self.pos
+        self.pos = pos + 4
+        return _I32.unpack_from(self.buf, pos)[0]
+
+    def read_u64(self):
+        pos = self.pos
+        self.pos = pos + 8
+        return _U64.unpack_from(self.buf, pos)[0]
+
+    def read_i64(self):
+        pos = self.pos
+        self.pos = pos + 8
+        return _I64.unpack_from(self.buf, pos)[0]
+
+    def read_uint256(self):
+        pos = self.pos
+        if pos + 32 > len(self.buf):
+            raise ValueError("read of uint256 past end of buffer")
+        self.pos = pos + 32
+        return int.from_bytes(self.buf[pos:pos + 32], "little")
+
+    def read_compact_size(self):
+        nit = self.read_u8()
+        if nit < 253:
+            return nit
+        if nit == 253:
+            return self.read_u16()
+        if nit == 254:
+            return self.read_u32()
+        return self.read_u64()
+
+    def read_string(self):
+        """Read a compact size prefixed string as bytes"""
+        n = self.read_compact_size()
+        start = self.pos
+        if start + n > len(self.buf):
+            raise ValueError(f"string of {n} bytes past end of buffer")
+        self.pos = start + n
+        return self.buf[start:start + n].tobytes()
+
+
+def read_stream(f, read_function, *args):
+    """Call read_function(reader, *args) on a ByteReader over the rest of the
+    BytesIO-like stream f and return its result.
+
+    The remaining bytes are copied once, so entry points that read many
+    objects (deser_vector, deser_block_spent_outputs) wrap the stream here
+    rather than letting each object copy it again. The stream is left
+    positioned right after the bytes that were consumed. Truncated input
+    raises struct.error, IndexError or ValueError from the ByteReader
+    instead of the silently short reads a plain stream would give."""
+    start = f.tell()
+    reader = ByteReader(f.read())
+    result = read_function(reader, *args)
+    f.seek(start + reader.pos)
+    return result
+
+
+def deserialize_stream(obj, f):
+    """Deserialize obj from a BytesIO-like stream by way of a ByteReader.
+
+    See read_stream() for positioning and truncation behaviour."""
+    return read_stream(f, obj.deserialize)
+
+
 def sha256(s):
     return hashlib.sha256(s).digest()
 
@@ -103,16 +235,23 @@ def hash256(s):
 
 
 def ser_compact_size(l):
-    r = b""
+    w = bytearray()
+    ser_compact_size_into(w, l)
+    return bytes(w)
+
+
+def ser_compact_size_into(w, l):
     if l < 253:
-        r = l.to_bytes(1, "little")
+        w.append(l)
     elif l < 0x10000:
-        r = (253).to_bytes(1, "little") + l.to_bytes(2, "little")
+        w.append(253)
+        w += l.to_bytes(2, "little")
     elif l < 0x100000000:
-        r = (254).to_bytes(1, "little") + l.to_bytes(4, "little")
+        w.append(254)
+        w += l.to_bytes(4, "little")
     else:
-        r = (255).to_bytes(1, "little") + l.to_bytes(8, "little")
-    return r
+        w.append(255)
+        w += l.to_bytes(8, "little")
 
 
 def deser_compact_size(f):
@@ -155,6 +294,11 @@ def ser_string(s):
     return ser_compact_size(len(s)) + s
 
 
+def ser_string_into(w, s):
+    ser_compact_size_into(w, len(s))
+    w += s
+
+
 def deser_uint256(f):
     return int.from_bytes(f.read(32), 'little')
 
@@ -176,6 +320,8 @@ def uint256_from_compact(c):
 # deser_function_name: Allow for an alternate deserialization function on the
 # entries in the vector.
 def deser_vector(f, c, deser_function_name=None):
+    if type(f) is not ByteReader:
+        return read_stream(f, deser_vector, c, deser_function_name)
     nit = deser_compact_size(f)
     r = []
     for _ in range(nit):
@@ -192,13 +338,42 @@ def deser_vector(f, c, deser_function_name=None):
 # entries in the vector (we use this for serializing the vector of transactions
 # for a witness block).
 def ser_vector(l, ser_function_name=None):
-    r = ser_compact_size(len(l))
+    w = bytearray()
+    ser_vector_into(w, l, ser_function_name)
+    return bytes(w)
+
+
+# (class, serializer name) -> name of the in-place serializer to use instead, or None
+_ser_into_names = {}
+
+
+def _ser_into_name(cls, name):
+    """Return name + "_into" if the class that defines cls.<name> also defines it.
+
+    A subclass that overrides only serialize() must not be bypassed by an
+    inherited serialize_into()."""
+    key = (cls, name)
+    if key not in _ser_into_names:
+        into = None
+        for base in cls.__mro__:
+            if name in base.__dict__:
+                if name + "_into" in base.__dict__:
+                    into = name + "_into"
+                break
+        _ser_into_names[key] = into
+    return _ser_into_names[key]
+
+
+def ser_vector_into(w, l, ser_function_name=None):
+    ser_compact_size_into(w, len(l))
+    name = ser_function_name or "serialize"
     for i in l:
-        if ser_function_name:
-            r += getattr(i, ser_function_name)()
+        # Objects with a writer-based serializer append in place
+        into = _ser_into_name(type(i), name)
+        if into:
+            getattr(i, into)(w)
         else:
-            r += i.serialize()
-    return r
+            w += getattr(i, name)()
 
 
 def deser_uint256_vector(f):
@@ -227,13 +402,20 @@ def deser_string_vector(f):
 
 
 def ser_string_vector(l):
-    r = ser_compact_size(len(l))
+    w = bytearray()
+    ser_string_vector_into(w, l)
+    return bytes(w)
+
+
+def ser_string_vector_into(w, l):
+    ser_compact_size_into(w, len(l))
     for sv in l:
-        r += ser_string(sv)
-    return r
+        ser_string_into(w, sv)
 
 
 def deser_block_spent_outputs(f):
+    if type(f) is not ByteReader:
+        return read_stream(f, deser_block_spent_outputs)
     nit = deser_compact_size(f)
     return [deser_vector(f, CTxOut) for _ in range(nit)]
 
@@ -244,7 +426,7 @@ def from_hex(obj, hex_string):
     Note that there is no complementary helper like e.g. `to_hex` for the
     inverse operation. To serialize a message object to a hex string, simply
     use obj.serialize().hex()"""
-    obj.deserialize(BytesIO(bytes.fromhex(hex_string)))
+    obj.deserialize(ByteReader(bytes.fromhex(hex_string)))
     return obj
 
 
@@ -257,9 +439,9 @@ def tx_from_hex(hex_string):
 def from_binary(cls, stream):
     """deserialize a binary stream (or bytes object) into an object"""
     # handle bytes object by turning it into a stream
-    was_bytes = isinstance(stream, bytes)
+    was_bytes = isinstance(stream, (bytes, bytearray, memoryview))
     if was_bytes:
-        stream = BytesIO(stream)
+        stream = ByteReader(stream)
     obj = cls()
     obj.deserialize(stream)
     if was_bytes:
@@ -460,14 +642,19 @@ class COutPoint:
         self.n = n
 
     def deserialize(self, f):
-        self.hash = deser_uint256(f)
-        self.n = int.from_bytes(f.read(4), "little")
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.hash = f.read_uint256()
+        self.n = f.read_u32()
 
     def serialize(self):
-        r = b""
-        r += ser_uint256(self.hash)
-        r += self.n.to_bytes(4, "little")
-        return r
+        w = bytearray()
+        self.serialize_into(w)
+        return bytes(w)
+
+    def serialize_into(self, w):
+        w += self.hash.to_bytes(32, "little")
+        w += self.n.to_bytes(4, "little")
 
     def __repr__(self):
         return "COutPoint(hash=%064x n=%i)" % (self.hash, self.n)
@@ -485,17 +672,21 @@ class CTxIn:
         self.nSequence = nSequence
 
     def deserialize(self, f):
-        self.prevout = COutPoint()
-        self.prevout.deserialize(f)
-        self.scriptSig = deser_string(f)
-        self.nSequence = int.from_bytes(f.read(4), "little")
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.prevout = COutPoint(f.read_uint256(), f.read_u32())
+        self.scriptSig = f.read_string()
+        self.nSequence = f.read_u32()
 
     def serialize(self):
-        r = b""
-        r += self.prevout.serialize()
-        r += ser_string(self.scriptSig)
-        r += self.nSequence.to_bytes(4, "little")
-        return r
+        w = bytearray()
+        self.serialize_into(w)
+        return bytes(w)
+
+    def serialize_into(self, w):
+        self.prevout.serialize_into(w)
+        ser_string_into(w, self.scriptSig)
+        w += self.nSequence.to_bytes(4, "little")
 
     def __repr__(self):
         return "CTxIn(prevout=%s scriptSig=%s nSequence=%i)" \
@@ -511,14 +702,19 @@ class CTxOut:
         self.scriptPubKey = scriptPubKey
 
     def deserialize(self, f):
-        self.nValue = int.from_bytes(f.read(8), "little", signed=True)
-        self.scriptPubKey = deser_string(f)
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.nValue = f.read_i64()
+        self.scriptPubKey = f.read_string()
 
     def serialize(self):
-        r = b""
-        r += self.nValue.to_bytes(8, "little", signed=True)
-        r += ser_string(self.scriptPubKey)
-        return r
+        w = bytearray()
+        self.serialize_into(w)
+        return bytes(w)
+
+    def serialize_into(self, w):
+        w += self.nValue.to_bytes(8, "little", signed=True)
+        ser_string_into(w, self.scriptPubKey)
 
     def __repr__(self):
         return "CTxOut(nValue=%i.%08i scriptPubKey=%s)" \
@@ -550,11 +746,16 @@ class CTxInWitness:
         self.scriptWitness = CScriptWitness()
 
     def deserialize(self, f):
-        self.scriptWitness.stack = deser_string_vector(f)
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.scriptWitness.stack = [f.read_string() for _ in range(f.read_compact_size())]
 
     def serialize(self):
         return ser_string_vector(self.scriptWitness.stack)
 
+    def serialize_into(self, w):
+        ser_string_vector_into(w, self.scriptWitness.stack)
+
     def __repr__(self):
         return repr(self.scriptWitness)
 
@@ -569,17 +770,22 @@ class CTxWitness:
         self.vtxinwit = []
 
     def deserialize(self, f):
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
         for i in range(len(self.vtxinwit)):
             self.vtxinwit[i].deserialize(f)
 
     def serialize(self):
-        r = b""
+        w = bytearray()
+        self.serialize_into(w)
+        return bytes(w)
+
+    def serialize_into(self, w):
         # This is different than the usual vector serialization --
         # we omit the length of the vector, which is required to be
         # the same length as the transaction's vin vector.
         for x in self.vtxinwit:
-            r += x.serialize()
-        return r
+            x.serialize_into(w)
 
     def __repr__(self):
         return "CTxWitness(%s)" % \
@@ -592,6 +798,24 @@ class CTxWitness:
         return True
 
 
+def deser_txin_vector(f):
+    vin = []
+    for _ in range(f.read_compact_size()):
+        txin = CTxIn()
+        txin.deserialize(f)
+        vin.append(txin)
+    return vin
+
+
+def deser_txout_vector(f):
+    vout = []
+    for _ in range(f.read_compact_size()):
+        txout = CTxOut()
+        txout.deserialize(f)
+        vout.append(txout)
+    return vout
+
+
 class CTransaction:
     __slots__ = ("nLockTime", "version", "vin", "vout", "wit")
 
@@ -610,61 +834,72 @@ class CTransaction:
             self.wit = copy.deepcopy(tx.wit)
 
     def deserialize(self, f):
-        self.version = int.from_bytes(f.read(4), "little")
-        self.vin = deser_vector(f, CTxIn)
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.version = f.read_u32()
+        self.vin = deser_txin_vector(f)
         flags = 0
         if len(self.vin) == 0:
-            flags = int.from_bytes(f.read(1), "little")
+            flags = f.read_u8()
             # Not sure why flags can't be zero, but this
             # matches the implementation in bitcoind
             if (flags != 0):
-                self.vin = deser_vector(f, CTxIn)
-                self.vout = deser_vector(f, CTxOut)
+                self.vin = deser_txin_vector(f)
+                self.vout = deser_txout_vector(f)
         else:
-            self.vout = deser_vector(f, CTxOut)
+            self.vout = deser_txout_vector(f)
         if flags != 0:
             self.wit.vtxinwit = [CTxInWitness() for _ in range(len(self.vin))]
             self.wit.deserialize(f)
         else:
             self.wit = CTxWitness()
-        self.nLockTime = int.from_bytes(f.read(4), "little")
+        self.nLockTime = f.read_u32()
 
     def serialize_without_witness(self):
-        r = b""
-        r += self.version.to_bytes(4, "little")
-        r += ser_vector(self.vin)
-        r += ser_vector(self.vout)
-        r += self.nLockTime.to_bytes(4, "little")
-        return r
+        w = bytearray()
+        self.serialize_without_witness_into(w)
+        return bytes(w)
+
+    def serialize_without_witness_into(self, w):
+        w += self.version.to_bytes(4, "little")
+        ser_vector_into(w, self.vin)
+        ser_vector_into(w, self.vout)
+        w += self.nLockTime.to_bytes(4, "little")
 
     # Only serialize with witness when explicitly called for
     def serialize_with_witness(self):
+        w = bytearray()
+        self.serialize_with_witness_into(w)
+        return bytes(w)
+
+    def serialize_with_witness_into(self, w):
         flags = 0
         if not self.wit.is_null():
             flags |= 1
-        r = b""
-        r += self.version.to_bytes(4, "little")
+        w += self.version.to_bytes(4, "little")
         if flags:
-            dummy = []
-            r += ser_vector(dummy)
-            r += flags.to_bytes(1, "little")
-        r += ser_vector(self.vin)
-        r += ser_vector(self.vout)
+            # empty vin vector as the segwit marker
+            w.append(0)
+            w.append(flags)
+        ser_vector_into(w, self.vin)
+        ser_vector_into(w, self.vout)
         if flags & 1:
             if (len(self.wit.vtxinwit) != len(self.vin)):
                 # vtxinwit must have the same length as vin
                 self.wit.vtxinwit = self.wit.vtxinwit[:len(self.vin)]
                 for _ in range(len(self.wit.vtxinwit), len(self.vin)):
                     self.wit.vtxinwit.append(CTxInWitness())
-            r += self.wit.serialize()
-        r += self.nLockTime.to_bytes(4, "little")
-        return r
+            self.wit.serialize_into(w)
+        w += self.nLockTime.to_bytes(4, "little")
 
     # Regular serialization is with witness -- must explicitly
     # call serialize_without_witness to exclude witness data.
     def serialize(self):
         return self.serialize_with_witness()
 
+    def serialize_into(self, w):
+        self.serialize_with_witness_into(w)
+
     @property
     def wtxid_hex(self):
         """Return wtxid (transaction hash with witness) as hex string."""
@@ -730,25 +965,33 @@ class CBlockHeader:
         self.nNonce = 0
 
     def deserialize(self, f):
-        self.nVersion = int.from_bytes(f.read(4), "little", signed=True)
-        self.hashPrevBlock = deser_uint256(f)
-        self.hashMerkleRoot = deser_uint256(f)
-        self.nTime = int.from_bytes(f.read(4), "little")
-        self.nBits = int.from_bytes(f.read(4), "little")
-        self.nNonce = int.from_bytes(f.read(4), "little")
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.nVersion = f.read_i32()
+        self.hashPrevBlock = f.read_uint256()
+        self.hashMerkleRoot = f.read_uint256()
+        self.nTime = f.read_u32()
+        self.nBits = f.read_u32()
+        self.nNonce = f.read_u32()
 
     def serialize(self):
         return self._serialize_header()
 
+    def serialize_into(self, w):
+        self._serialize_header_into(w)
+
     def _serialize_header(self):
-        r = b""
-        r += self.nVersion.to_bytes(4, "little", signed=True)
-        r += ser_uint256(self.hashPrevBlock)
-        r += ser_uint256(self.hashMerkleRoot)
-        r += self.nTime.to_bytes(4, "little")
-        r += self.nBits.to_bytes(4, "little")
-        r += self.nNonce.to_bytes(4, "little")
-        return r
+        w = bytearray()
+        self._serialize_header_into(w)
+        return bytes(w)
+
+    def _serialize_header_into(self, w):
+        w += self.nVersion.to_bytes(4, "little", signed=True)
+        w += self.hashPrevBlock.to_bytes(32, "little")
+        w += self.hashMerkleRoot.to_bytes(32, "little")
+        w += self.nTime.to_bytes(4, "little")
+        w += self.nBits.to_bytes(4, "little")
+        w += self.nNonce.to_bytes(4, "little")
 
     @property
     def hash_hex(self):
@@ -768,6 +1011,90 @@ class CBlockHeader:
 BLOCK_HEADER_SIZE = len(CBlockHeader().serialize())
 assert_equal(BLOCK_HEADER_SIZE, 80)
 
+
+class HeaderHasher:
+    """Hash one block header for many nonces.
+
+    The SHA256 state after the first 64 header bytes is computed once, so
+    each nonce only costs the final 16-byte block and the second SHA256."""
+    __slots__ = ("midstate", "tail")
+
+    # Nonces tried per scan() call by CBlock.solve
+    BATCH = 1 << 16
+
+    def __init__(self, header):
+        data = CBlockHeader.serialize(header)
+        self.midstate = hashlib.sha256(data[:64])
+        # end of the merkle root, nTime and nBits, followed by the nonce
+        self.tail = bytearray(data[64:80])
+
+    def hash(self, nonce):
+        """Return the header hash with the given nonce, as bytes"""
+        _U32.pack_into(self.tail, 12, nonce)
+        h = self.midstate.copy()
+        h.update(self.tail)
+        return sha256(h.digest())
+
+    def scan(self, target, start, count):
+        """Return the first nonce in [start, start + count) whose hash is
+        at most target, or None"""
+        tail = self.tail
+        copy_midstate = self.midstate.copy
+        pack_nonce = _U32.pack_into
+        from_bytes = int.from_bytes
+        for nonce in range(start, start + count):
+            pack_nonce(tail, 12, nonce)
+            h = copy_midstate()
+            h.update(tail)
+            if from_bytes(hashlib.sha256(h.digest()).digest(), "little") <= target:
+                return nonce
+        return None
+
+class MerkleTree:
+    """Bitcoin merkle tree that keeps all of its levels.
+
+    Every level is a single bytearray of concatenated 32-byte hashes, so
+    pairs are hashed straight from slices of it. set_leaf() only rehashes
+    the path from the changed leaf to the root, which is what block
+    templates need when nothing but the coinbase changes."""
+    __slots__ = ("levels",)
+
+    def __init__(self, hashes):
+        level = bytearray(b"".join(hashes))
+        assert len(level) and len(level) % 32 == 0
+        self.levels = [level]
+        while len(level) > 32:
+            level = self._parent_level(level)
+            self.levels.append(level)
+
+    @staticmethod
+    def _parent_level(level):
+        view = memoryview(level)
+        parent = bytearray()
+        end = len(level) - len(level) % 64
+        for pos in range(0, end, 64):
+            parent += sha256(sha256(view[pos:pos + 64]))
+        if end != len(level):
+            # an odd hash out is paired with itself
+            parent += hash256(level[end:] * 2)
+        return parent
+
+    @property
+    def root(self):
+        """Return the merkle root as an integer."""
+        return uint256_from_str(self.levels[-1])
+
+    def set_leaf(self, index, h):
+        """Replace the leaf hash at index and rehash its path to the root"""
+        assert len(h) == 32
+        self.levels[0][32 * index:32 * index + 32] = h
+        for child, parent in zip(self.levels, self.levels[1:]):
+            left = (index & ~1) * 32
+            right = min(left + 32, len(child) - 32)
+            index //= 2
+            parent[32 * index:32 * index + 32] = hash256(child[left:left + 32] + child[right:right + 32])
+
+
 class CBlock(CBlockHeader):
     __slots__ = ("vtx",)
 
@@ -776,34 +1103,34 @@ class CBlock(CBlockHeader):
         self.vtx = []
 
     def deserialize(self, f):
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
         super().deserialize(f)
         self.vtx = deser_vector(f, CTransaction)
 
     def serialize(self, with_witness=True):
-        r = b""
-        r += super().serialize()
+        w = bytearray()
+        self.serialize_into(w, with_witness)
+        return bytes(w)
+
+    def serialize_into(self, w, with_witness=True):
+        self._serialize_header_into(w)
         if with_witness:
-            r += ser_vector(self.vtx, "serialize_with_witness")
+            ser_vector_into(w, self.vtx, "serialize_with_witness")
         else:
-            r += ser_vector(self.vtx, "serialize_without_witness")
-        return r
+            ser_vector_into(w, self.vtx, "serialize_without_witness")
 
     # Calculate the merkle root given a vector of transaction hashes
     @classmethod
     def get_merkle_root(cls, hashes):
-        while len(hashes) > 1:
-            newhashes = []
-            for i in range(0, len(hashes), 2):
-                i2 = min(i+1, len(hashes)-1)
-                newhashes.append(hash256(hashes[i] + hashes[i2]))
-            hashes = newhashes
-        return uint256_from_str(hashes[0])
+        return MerkleTree(hashes).root
+
+    def merkle_tree(self):
+        """Return the MerkleTree of the txids, to update after changing the coinbase"""
+        return MerkleTree([ser_uint256(tx.txid_int) for tx in self.vtx])
 
     def calc_merkle_root(self):
-        hashes = []
-        for tx in self.vtx:
-            hashes.append(ser_uint256(tx.txid_int))
-        return self.get_merkle_root(hashes)
+        return self.merkle_tree().root
 
     def calc_witness_merkle_root(self):
         # For witness root purposes, the hash of the
@@ -829,8 +1156,18 @@ class CBlock(CBlockHeader):
 
     def solve(self):
         target = uint256_from_compact(self.nBits)
-        while self.hash_int > target:
-            self.nNonce += 1
+        while True:
+            hasher = HeaderHasher(self)
+            while self.nNonce <= 0xffffffff:
+                count = min(HeaderHasher.BATCH, 0x100000000 - self.nNonce)
+                nonce = hasher.scan(target, self.nNonce, count)
+                if nonce is not None:
+                    self.nNonce = nonce
+                    return
+                self.nNonce += count
+            # Nonce space exhausted, roll the time like a real miner would
+            self.nTime += 1
+            self.nNonce = 0
 
     # Calculate the block weight using witness and non-witness
     # serialization size (does NOT use sigops).
@@ -845,6 +1182,182 @@ class CBlock(CBlockHeader):
                time.ctime(self.nTime), self.nBits, self.nNonce, repr(self.vtx))
 
 
+def skip_transaction(f):
+    """Move ByteReader f past a serialized transaction without decoding it.
+
+    Returns the offset of the witness data, or None if the transaction has none."""
+    start = f.pos
+    f.pos += 4
+    n_in = f.read_compact_size()
+    witness = False
+    if n_in == 0:
+        # Either the segwit marker or an empty vin followed by an empty vout,
+        # see CTransaction.deserialize
+        if f.read_u8() != 0:
+            witness = True
+            n_in = f.read_compact_size()
+            n_out = None
+        else:
+            n_out = 0
+    else:
+        n_out = None
+    for _ in range(n_in):
+        f.pos += 36
+        script_len = f.read_compact_size()
+        f.pos += script_len + 4
+    if n_out is None:
+        n_out = f.read_compact_size()
+    for _ in range(n_out):
+        f.pos += 8
+        script_len = f.read_compact_size()
+        f.pos += script_len
+    witness_start = None
+    if witness:
+        witness_start = f.pos
+        for _ in range(n_in):
+            for _ in range(f.read_compact_size()):
+                item_len = f.read_compact_size()
+                f.pos += item_len
+    f.pos += 4
+    if f.pos > len(f.buf):
+        raise ValueError(f"transaction at offset {start} runs past end of buffer")
+    return witness_start
+
+
+class LazyTransaction:
+    """A transaction kept as a slice of the buffer it was received in.
+
+    Hashes, sizes and serialization work directly on the raw bytes. Any
+    other attribute is looked up on a CTransaction decoded on first access,
+    which is a read-only view: decode a copy with .tx and modify that."""
+    __slots__ = ("data", "start", "witness_start", "end", "_tx", "_hashes")
+
+    def __init__(self, data=b"", start=0, witness_start=None, end=None):
+        self.data = memoryview(data)
+        self.start = start
+        self.witness_start = witness_start
+        self.end = len(self.data) if end is None else end
+        self._tx = None
+        self._hashes = {}
+
+    def deserialize(self, f):
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        self.data = f.buf
+        self.start = f.pos
+        self.witness_start = skip_transaction(f)
+        self.end = f.pos
+        self._tx = None
+        self._hashes = {}
+
+    @property
+    def tx(self):
+        """Return the decoded CTransaction"""
+        if self._tx is None:
+            tx = CTransaction()
+            tx.deserialize(ByteReader(self.data[self.start:self.end]))
+            self._tx = tx
+        return self._tx
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined here, i.e. the decoded fields
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.tx, name)
+
+    def _stripped_parts(self):
+        if self.witness_start is None:
+            return (self.data[self.start:self.end],)
+        # version, then everything between the marker/flag and the witness, then locktime
+        return (self.data[self.start:self.start + 4],
+                self.data[self.start + 6:self.witness_start],
+                self.data[self.end - 4:self.end])
+
+    def _hash(self, with_witness):
+        hashes = self._hashes
+        if with_witness not in hashes:
+            if with_witness and self.witness_start is None:
+                hashes[True] = self._hash(False)
+            else:
+                h = hashlib.sha256()
+                parts = (self.data[self.start:self.end],) if with_witness else self._stripped_parts()
+                for part in parts:
+                    h.update(part)
+                hashes[with_witness] = sha256(h.digest())
+        return hashes[with_witness]
+
+    @property
+    def wtxid_hex(self):
+        """Return wtxid (transaction hash with witness) as hex string."""
+        return self._hash(True)[::-1].hex()
+
+    @property
+    def wtxid_int(self):
+        """Return wtxid (transaction hash with witness) as integer."""
+        return uint256_from_str(self._hash(True))
+
+    @property
+    def txid_hex(self):
+        """Return txid (transaction hash without witness) as hex string."""
+        return self._hash(False)[::-1].hex()
+
+    @property
+    def txid_int(self):
+        """Return txid (transaction hash without witness) as integer."""
+        return uint256_from_str(self._hash(False))
+
+    def serialize_with_witness_into(self, w):
+        w += self.data[self.start:self.end]
+
+    def serialize_without_witness_into(self, w):
+        for part in self._stripped_parts():
+            w += part
+
+    def serialize_with_witness(self):
+        return self.data[self.start:self.end].tobytes()
+
+    def serialize_without_witness(self):
+        return b"".join(self._stripped_parts())
+
+    def serialize(self):
+        return self.serialize_with_witness()
+
+    def serialize_into(self, w):
+        self.serialize_with_witness_into(w)
+
+    def get_weight(self):
+        with_witness_size = self.end - self.start
+        without_witness_size = sum(len(part) for part in self._stripped_parts())
+        return (WITNESS_SCALE_FACTOR - 1) * without_witness_size + with_witness_size
+
+    def get_vsize(self):
+        return math.ceil(self.get_weight() / WITNESS_SCALE_FACTOR)
+
+    def __repr__(self):
+        return "LazyTransaction(size=%i witness=%s)" % (self.end - self.start, self.witness_start is not None)
+
+
+class LazyBlock(CBlock):
+    """A block whose header is decoded on receipt and whose vtx holds
+    LazyTransactions indexing into the received buffer."""
+    __slots__ = ()
+
+    def deserialize(self, f):
+        if type(f) is not ByteReader:
+            return deserialize_stream(self, f)
+        CBlockHeader.deserialize(self, f)
+        self.vtx = []
+        for _ in range(f.read_compact_size()):
+            tx = LazyTransaction()
+            tx.deserialize(f)
+            self.vtx.append(tx)
+
+    def __repr__(self):
+        return "LazyBlock(nVersion=%i hashPrevBlock=%064x hashMerkleRoot=%064x nTime=%s nBits=%08x nNonce=%08x vtx=<%i transactions>)" \
+            % (self.nVersion, self.hashPrevBlock, self.hashMerkleRoot,
+               time.ctime(self.nTime), self.nBits, self.nNonce, len(self.vtx))
+
+
 class PrefilledTransaction:
     __slots__ = ("index", "tx")
 
@@ -1385,6 +1898,21 @@ class msg_no_witness_block(msg_block):
         return self.block.serialize(with_witness=False)
 
 
+# Received in place of msg_block/msg_tx by connections with lazy_messages set
+class msg_lazy_block(msg_block):
+    __slots__ = ()
+
+    def __init__(self, block=None):
+        super().__init__(LazyBlock() if block is None else block)
+
+
+class msg_lazy_tx(msg_tx):
+    __slots__ = ()
+
+    def __init__(self, tx=None):
+        super().__init__(LazyTransaction() if tx is None else tx)
+
+
 class msg_getaddr:
     __slots__ = ()
     msgtype = b"getaddr"
@@ -1907,6 +2435,138 @@ class msg_sendtxrcncl:
             (self.version, self.salt)
 
 class TestFrameworkScript(unittest.TestCase):
+    def test_serialize_into(self):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(0xaa, 1), b"\x51" * 300, 0)]
+        tx.vout = [CTxOut(1000, b"\x51"), CTxOut(2000, b"")]
+        tx.wit.vtxinwit = [CTxInWitness()]
+        tx.wit.vtxinwit[0].scriptWitness.stack = [b"\x01", b"\x02" * 70000]
+        block = CBlock()
+        block.vtx = [tx, CTransaction(tx)]
+        block.vtx[1].wit = CTxWitness()
+
+        # the writer appends to whatever is already in the buffer
+        w = bytearray(b"prefix")
+        block.serialize_into(w)
+        self.assertEqual(bytes(w[6:]), block.serialize())
+        self.assertEqual(from_binary(CBlock, block.serialize()).serialize(), block.serialize())
+        self.assertEqual(from_binary(CBlock, block.serialize(with_witness=False)).vtx[0].wit.is_null(), True)
+        self.assertEqual(tx_from_hex(tx.serialize().hex()).serialize_without_witness(),
+                         tx.serialize_without_witness())
+
+        # a subclass overriding only serialize() is not bypassed by the inherited serialize_into()
+        class CustomTxOut(CTxOut):
+            def serialize(self):
+                return b"custom"
+        self.assertEqual(ser_vector([CustomTxOut(), CTxOut(1, b"")]),
+                         b"\x02custom" + CTxOut(1, b"").serialize())
+
+    def test_byte_reader(self):
+        data = bytes.fromhex("01") + (0xfd).to_bytes(1, "little") + (300).to_bytes(2, "little") + b"\x03abc"
+        r = ByteReader(data)
+        self.assertEqual(r.read_u8(), 1)
+        self.assertEqual(r.read_compact_size(), 300)
+        self.assertEqual(r.read_string(), b"abc")
+        self.assertEqual(r.remaining(), 0)
+        r.seek(1)
+        self.assertEqual(bytes(r.read_bytes(3)), data[1:4])
+        self.assertEqual(r.read(), b"\x03abc")
+        self.assertRaises(ValueError, ByteReader(b"\x05ab").read_string)
+
+        # deserializing from a plain stream leaves it positioned after the object
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(0xaa, 1), b"\x51", 0)]
+        tx.vout = [CTxOut(-1, b"\x51")]
+        f = BytesIO(tx.serialize() + b"trailing")
+        decoded = CTransaction()
+        decoded.deserialize(f)
+        self.assertEqual(decoded.serialize(), tx.serialize())
+        self.assertEqual(decoded.vout[0].nValue, -1)
+        self.assertEqual(f.read(), b"trailing")
+
+        # a vector read from a plain stream copies the stream once, not once per element
+        class CountingBytesIO(BytesIO):
+            reads = 0
+
+            def read(self, *args):
+                self.reads += 1
+                return super().read(*args)
+        outs = [CTxOut(i, b"\x51") for i in range(50)]
+        f = CountingBytesIO(ser_vector(outs) + b"trailing")
+        self.assertEqual([o.nValue for o in deser_vector(f, CTxOut)], list(range(50)))
+        self.assertEqual(f.reads, 1)
+        self.assertEqual(f.read(), b"trailing")
+        self.assertRaises(struct.error, deser_vector, BytesIO(ser_vector(outs)[:-10]), CTxOut)
+
+    def test_lazy_block(self):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(0xaa, 1), b"\x51", 0), CTxIn(COutPoint(0xbb, 0))]
+        tx.vout = [CTxOut(1000, b"\x51" * 300)]
+        tx.wit.vtxinwit = [CTxInWitness(), CTxInWitness()]
+        tx.wit.vtxinwit[1].scriptWitness.stack = [b"\x01", b"\x02" * 300]
+        legacy = CTransaction(tx)
+        legacy.wit = CTxWitness()
+        block = CBlock()
+        block.nNonce = 7
+        block.vtx = [legacy, tx]
+
+        lazy = from_binary(LazyBlock, block.serialize())
+        self.assertEqual(lazy.hash_int, block.hash_int)
+        self.assertEqual(lazy.serialize(), block.serialize())
+        self.assertEqual(lazy.serialize(with_witness=False), block.serialize(with_witness=False))
+        self.assertEqual(lazy.get_weight(), block.get_weight())
+        self.assertEqual(lazy.calc_witness_merkle_root(), block.calc_witness_merkle_root())
+        for lazy_tx, real_tx in zip(lazy.vtx, block.vtx):
+            self.assertEqual(lazy_tx.txid_hex, real_tx.txid_hex)
+            self.assertEqual(lazy_tx.wtxid_int, real_tx.wtxid_int)
+            self.assertEqual(lazy_tx.get_vsize(), real_tx.get_vsize())
+            self.assertIsNone(lazy_tx._tx)
+            # fields decode on first access
+            self.assertEqual(lazy_tx.vout[0].scriptPubKey, real_tx.vout[0].scriptPubKey)
+            self.assertEqual(lazy_tx.tx.serialize(), real_tx.serialize())
+
+        msg = msg_lazy_tx()
+        msg.deserialize(BytesIO(tx.serialize()))
+        self.assertEqual(msg.serialize(), msg_tx(tx).serialize())
+        self.assertRaises(ValueError, from_binary, LazyTransaction, tx.serialize()[:-5])
+
+    def test_merkle_tree(self):
+        def naive_root(hashes):
+            while len(hashes) > 1:
+                hashes = [hash256(hashes[i] + hashes[min(i + 1, len(hashes) - 1)])
+                          for i in range(0, len(hashes), 2)]
+            return uint256_from_str(hashes[0])
+
+        for n in (1, 2, 3, 7, 8, 33):
+            hashes = [sha256(bytes([i])) for i in range(n)]
+            tree = MerkleTree(hashes)
+            self.assertEqual(tree.root, naive_root(hashes))
+            for index in (0, n - 1, n // 2):
+                hashes[index] = sha256(hashes[index])
+                tree.set_leaf(index, hashes[index])
+                self.assertEqual(tree.root, naive_root(hashes))
+
+    def test_header_hasher(self):
+        block = CBlock()
+        block.hashPrevBlock = 0xab
+        block.hashMerkleRoot = 0xcd
+        block.nTime = 1700000000
+        block.nBits = 0x207fffff
+        hasher = HeaderHasher(block)
+        for nonce in (0, 1, 0xffffffff):
+            block.nNonce = nonce
+            self.assertEqual(uint256_from_str(hasher.hash(nonce)), block.hash_int)
+
+        # a quarter of hashes are below this target
+        target = 1 << 254
+        block.nNonce = 0
+        expected = next(n for n in range(100) if uint256_from_str(hasher.hash(n)) <= target)
+        self.assertEqual(hasher.scan(target, 0, 100), expected)
+        self.assertIsNone(hasher.scan(0, 0, 100))
+        block.nBits = 0x1f3fffff
+        block.solve()
+        self.assertLessEqual(block.hash_int, uint256_from_compact(block.nBits))
+
     def test_addrv2_encode_decode(self):
         def check_addrv2(ip, net):
             addr = CAddress()
@@ -21,16 +21,25 @@ P2PTxInvStore: A p2p interface class that inherits from P2PDataStore, and keeps
               a count of how many times each txid has been announced."""
 
 import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
 from io import BytesIO
+import itertools
 import logging
 import platform
+import socket
 import struct
 import sys
 import threading
+import unittest
 
 from test_framework.messages import (
+    ByteReader,
+    CBlock,
     CBlockHeader,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxOut,
     MAX_HEADERS_RESULTS,
     msg_addr,
     msg_addrv2,
@@ -55,6 +64,8 @@ from test_framework.messages import (
     msg_getheaders,
     msg_headers,
     msg_inv,
+    msg_lazy_block,
+    msg_lazy_tx,
     msg_mempool,
     msg_merkleblock,
     msg_notfound,
@@ -80,6 +91,7 @@ from test_framework.util import (
     assert_not_equal,
     MAX_NODES,
     p2p_port,
+    StateChanges,
     wait_until_helper_internal,
 )
 from test_framework.v2_p2p import (
@@ -109,6 +121,10 @@ TXID_RELAY_DELAY = 2
 OVERLOADED_PEER_TX_DELAY = 2
 # How long to wait before downloading a transaction from an additional peer
 GETDATA_TX_INTERVAL = 60
+# Bytes the asyncio transport buffers before it pauses writing to a peer that does not keep up
+SEND_BUFFER_HIGH_WATER = 4 * 1024 * 1024
+# Bytes send_blocking() and send_async() let queue up while writing is paused
+SEND_QUEUE_LIMIT = 4 * 1024 * 1024
 
 MESSAGEMAP = {
     b"addr": msg_addr,
@@ -148,6 +164,40 @@ MESSAGEMAP = {
     b"wtxidrelay": msg_wtxidrelay,
 }
 
+# Used instead of MESSAGEMAP entries when P2PConnection.lazy_messages is set
+LAZY_MESSAGEMAP = {
+    b"block": msg_lazy_block,
+    b"tx": msg_lazy_tx,
+}
+
+
+class SendQueueStats:
+    """Outbound queue counters of a P2PConnection, see P2PConnection.send_queue_stats()"""
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        # transport writes, each carrying every message queued since the previous one
+        self.writes = 0
+        self.pauses = 0
+        self.max_queued_messages = 0
+        self.max_queued_bytes = 0
+
+    def add(self, size, queued_messages, queued_bytes):
+        self.messages += 1
+        self.bytes += size
+        self.max_queued_messages = max(self.max_queued_messages, queued_messages)
+        self.max_queued_bytes = max(self.max_queued_bytes, queued_bytes)
+
+    def to_dict(self):
+        return {
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "writes": self.writes,
+            "pauses": self.pauses,
+            "max_queued_messages": self.max_queued_messages,
+            "max_queued_bytes": self.max_queued_bytes,
+        }
+
 
 class P2PConnection(asyncio.Protocol):
     """A low-level connection object to a node's P2P interface.
@@ -169,8 +219,25 @@ class P2PConnection(asyncio.Protocol):
         # This lock is acquired before sending messages over the socket. There's an implied lock order and
         # p2p_lock must not be acquired after _send_lock as it could result in deadlocks.
         self._send_lock = threading.Lock()
+        # The event loop the connection runs on, one of NetworkThread.network_event_loops
+        self._loop = None
+        # Messages waiting for the event loop to write them, see send_raw_message().
+        # The condition is notified whenever the queue empties or the connection closes.
+        self._send_queue = deque()
+        self._send_queue_bytes = 0
+        self._send_queue_cond = threading.Condition(threading.Lock())
+        self._send_scheduled = False
+        # Set between the transport's pause_writing() and resume_writing() callbacks
+        self._writing_paused = False
+        # Futures of send_async() calls waiting for the queue to drain
+        self._drain_waiters = []
+        self.send_buffer_high_water = SEND_BUFFER_HIGH_WATER
+        self.send_stats = SendQueueStats()
         self.v2_state = None  # EncryptedP2PState object needed for v2 p2p connections
         self.reconnect = False  # set if reconnection needs to happen
+        # Receive block and tx payloads as LazyBlock/LazyTransaction, which skip
+        # decoding until the fields are used. Handlers must treat them as read-only.
+        self.lazy_messages = False
 
     @property
     def is_connected(self):
@@ -187,7 +254,9 @@ class P2PConnection(asyncio.Protocol):
         self.dstport = dstport
         # The initial message to send after the connection was made:
         self.on_connection_send_msg = None
-        self.recvbuf = b""
+        self.recvbuf = bytearray()
+        # Bytes of recvbuf before this offset have been consumed, see _append_recvbuf()
+        self.recv_offset = 0
         self.magic_bytes = MAGIC_BYTES[net]
         self.p2p_connected_to_node = dstport != 0
 
@@ -196,7 +265,8 @@ class P2PConnection(asyncio.Protocol):
         if supports_v2_p2p:
             self.v2_state = EncryptedP2PState(initiating=True, net=net)
 
-        loop = NetworkThread.network_event_loop
+        loop = NetworkThread.next_event_loop()
+        self._loop = loop
         logger.debug('Connecting to Bitcoin Node: %s:%d' % (self.dstaddr, self.dstport))
         coroutine = loop.create_connection(lambda: self, host=self.dstaddr, port=self.dstport)
         return lambda: loop.call_soon_threadsafe(loop.create_task, coroutine)
@@ -212,7 +282,8 @@ class P2PConnection(asyncio.Protocol):
 
     def peer_disconnect(self):
         # Connection could have already been closed by other end.
-        NetworkThread.network_event_loop.call_soon_threadsafe(lambda: self._transport and self._transport.abort())
+        loop = self._loop or NetworkThread.network_event_loop
+        loop.call_soon_threadsafe(lambda: self._transport and self._transport.abort())
 
     # Connection and disconnection methods
 
@@ -226,6 +297,9 @@ class P2PConnection(asyncio.Protocol):
         self.dstaddr = them[0]
         self.dstport = them[1]
         self._transport = transport
+        # Inbound connections are made on the loop of the listening server
+        self._loop = asyncio.get_running_loop()
+        transport.set_write_buffer_limits(high=self.send_buffer_high_water)
         # in an inbound connection to the TestNode with P2PConnection as the initiator, [TestNode <---- P2PConnection]
         # send the initial handshake immediately
         if self.supports_v2_p2p and self.v2_state.initiating and not self.v2_state.tried_v2_handshake:
@@ -237,6 +311,7 @@ class P2PConnection(asyncio.Protocol):
         if self.p2p_connected_to_node and not self.supports_v2_p2p:
             self.send_version()
         self.on_open()
+        p2p_state_changes.notify()
 
     def connection_lost(self, exc):
         """asyncio callback when a connection is closed."""
@@ -246,8 +321,16 @@ class P2PConnection(asyncio.Protocol):
         else:
             logger.debug("Closed connection to: %s:%d" % (self.dstaddr, self.dstport))
         self._transport = None
-        self.recvbuf = b""
+        with self._send_queue_cond:
+            self._send_queue.clear()
+            self._send_queue_bytes = 0
+            self._writing_paused = False
+            self._send_queue_cond.notify_all()
+        self._wake_drain_waiters()
+        self.recvbuf = bytearray()
+        self.recv_offset = 0
         self.on_close()
+        p2p_state_changes.notify()
 
     # v2 handshake method
     def _on_data_v2_handshake(self):
@@ -302,31 +385,51 @@ class P2PConnection(asyncio.Protocol):
 
     # Socket read methods
 
+    def _append_recvbuf(self, data):
+        """Append to the receive buffer. Consumed bytes are only dropped once they make up
+        half of the buffer, which keeps reading a message split over many reads linear."""
+        offset = self.recv_offset
+        try:
+            if offset and 2 * offset >= len(self.recvbuf):
+                del self.recvbuf[:offset]
+                self.recv_offset = 0
+            self.recvbuf += data
+        except BufferError:
+            # A handler kept a memoryview of the buffer, which pins its size. Leave it
+            # with the old buffer and continue in a new one.
+            self.recvbuf = self.recvbuf[self.recv_offset:] + data
+            self.recv_offset = 0
+
     def data_received(self, t):
         """asyncio callback when data is read from the socket."""
         if len(t) > 0:
-            self.recvbuf += t
+            self._append_recvbuf(t)
             if self.supports_v2_p2p and not self.v2_state.tried_v2_handshake:
                 self._on_data_v2_handshake()
             else:
                 self._on_data()
+            p2p_state_changes.notify()
 
     def _on_data(self):
         """Try to read P2P messages from the recv buffer.
 
         This method reads data from the buffer in a loop. It deserializes,
         parses and verifies the P2P header, then passes the P2P payload to
-        the on_message callback for processing."""
+        the on_message callback for processing.
+
+        Headers are parsed and payloads deserialized through memoryviews of
+        the receive buffer, so no message is copied out of it first."""
         try:
             while True:
+                buf = memoryview(self.recvbuf)[self.recv_offset:]
                 if self.supports_v2_p2p:
                     # v2 P2P messages are read
-                    msglen, msg = self.v2_state.v2_receive_packet(self.recvbuf)
+                    msglen, msg = self.v2_state.v2_receive_packet(buf)
                     if msglen == -1:
-                        raise ValueError("invalid v2 mac tag " + repr(self.recvbuf))
+                        raise ValueError("invalid v2 mac tag " + repr(bytes(buf)))
                     elif msglen == 0:  # need to receive more bytes in recvbuf
                         return
-                    self.recvbuf = self.recvbuf[msglen:]
+                    self.recv_offset += msglen
 
                     if msg is None:  # ignore decoy messages
                         return
@@ -336,35 +439,45 @@ class P2PConnection(asyncio.Protocol):
                         # next 12 bytes are interpreted as ASCII message type if shortid is b'\x00'
                         if len(msg) < 13:
                             raise IndexError("msg needs minimum required length of 13 bytes")
-                        msgtype = msg[1:13].rstrip(b'\x00')
+                        msgtype = bytes(msg[1:13]).rstrip(b'\x00')
                         msg = msg[13:]  # msg is set to be payload
                     else:
                         # a 1-byte short message type ID
                         msgtype = SHORTID.get(shortid, f"unknown-{shortid}")
                         msg = msg[1:]
+                    # The payload is a view of the decrypted packet, not of recvbuf,
+                    # so lazy messages may keep it
+                    payload = msg
                 else:
                     # v1 P2P messages are read
-                    if len(self.recvbuf) < 4:
+                    if len(buf) < 4:
                         return
-                    if self.recvbuf[:4] != self.magic_bytes:
-                        raise ValueError("magic bytes mismatch: {} != {}".format(repr(self.magic_bytes), repr(self.recvbuf)))
-                    if len(self.recvbuf) < 4 + 12 + 4 + 4:
+                    if buf[:4] != self.magic_bytes:
+                        raise ValueError("magic bytes mismatch: {} != {}".format(repr(self.magic_bytes), repr(bytes(buf))))
+                    if len(buf) < 4 + 12 + 4 + 4:
                         return
-                    msgtype = self.recvbuf[4:4+12].split(b"\x00", 1)[0]
-                    msglen = struct.unpack("<i", self.recvbuf[4+12:4+12+4])[0]
-                    checksum = self.recvbuf[4+12+4:4+12+4+4]
-                    if len(self.recvbuf) < 4 + 12 + 4 + 4 + msglen:
+                    msgtype = bytes(buf[4:4+12]).split(b"\x00", 1)[0]
+                    msglen = struct.unpack_from("<i", buf, 4+12)[0]
+                    checksum = buf[4+12+4:4+12+4+4]
+                    if len(buf) < 4 + 12 + 4 + 4 + msglen:
                         return
-                    msg = self.recvbuf[4+12+4+4:4+12+4+4+msglen]
+                    msg = buf[4+12+4+4:4+12+4+4+msglen]
                     th = sha256(msg)
                     h = sha256(th)
                     if checksum != h[:4]:
-                        raise ValueError("got bad checksum " + repr(self.recvbuf))
-                    self.recvbuf = self.recvbuf[4+12+4+4+msglen:]
+                        raise ValueError("got bad checksum " + repr(bytes(buf)))
+                    self.recv_offset += 4+12+4+4+msglen
+                    payload = None
                 if msgtype not in MESSAGEMAP:
-                    raise ValueError("Received unknown msgtype from %s:%d: '%s' %s" % (self.dstaddr, self.dstport, msgtype, repr(msg)))
-                f = BytesIO(msg)
-                t = MESSAGEMAP[msgtype]()
+                    raise ValueError("Received unknown msgtype from %s:%d: '%s' %s" % (self.dstaddr, self.dstport, msgtype, repr(bytes(msg))))
+                if self.lazy_messages and msgtype in LAZY_MESSAGEMAP:
+                    t = LAZY_MESSAGEMAP[msgtype]()
+                    # Lazy messages keep their buffer, which must not be a view
+                    # of recvbuf as that is reused for the next reads
+                    f = ByteReader(payload if payload is not None else bytes(msg))
+                else:
+                    t = MESSAGEMAP[msgtype]()
+                    f = ByteReader(msg)
                 t.deserialize(f)
                 self._log_message("receive", t)
                 self.on_message(t)
@@ -395,17 +508,97 @@ class P2PConnection(asyncio.Protocol):
             self._log_message("send", message)
             return self.send_raw_message(tmsg)
 
-    def send_raw_message(self, raw_message_bytes):
+    def send_blocking(self, message, *, timeout=60):
+        """Send a P2P message once fewer than SEND_QUEUE_LIMIT bytes are queued.
+
+        Unlike send_without_ping, this bounds the memory used when flooding a
+        peer that reads slower than we send. Must not be called on the event loop."""
+        self.wait_for_send_queue(timeout=timeout)
+        self.send_without_ping(message)
+
+    async def send_async(self, message):
+        """Coroutine version of send_blocking, for code running on the connection's event loop."""
+        while self.is_connected and not self._send_queue_writable(SEND_QUEUE_LIMIT):
+            waiter = self._loop.create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+        self.send_without_ping(message)
+
+    def wait_for_send_queue(self, *, limit=SEND_QUEUE_LIMIT, timeout=60):
+        """Block until fewer than limit bytes are queued for sending, or the queue is empty."""
+        timeout = timeout * self.timeout_factor
+        with self._send_queue_cond:
+            if not self._send_queue_cond.wait_for(
+                    lambda: not self.is_connected or self._send_queue_writable(limit), timeout):
+                raise AssertionError(f"Send queue to {self.dstaddr}:{self.dstport} still holds "
+                                     f"{self._send_queue_bytes} bytes after {timeout} seconds")
         if not self.is_connected:
             raise IOError('Not connected')
 
-        def maybe_write():
-            if not self._transport:
+    def send_queue_stats(self):
+        """Return the outbound queue counters and current depth as a dict."""
+        with self._send_queue_cond:
+            stats = self.send_stats.to_dict()
+            stats["queued_messages"] = len(self._send_queue)
+            stats["queued_bytes"] = self._send_queue_bytes
+            stats["writing_paused"] = self._writing_paused
+        return stats
+
+    def send_raw_message(self, raw_message_bytes):
+        """Queue raw bytes for the event loop to write. Safe to call from any thread.
+
+        Only the first message queued since the last flush wakes the event loop, which
+        then hands everything queued so far to the transport in a single write.
+        The queue is not bounded here, see send_blocking()."""
+        if not self.is_connected:
+            raise IOError('Not connected')
+        with self._send_queue_cond:
+            self._send_queue.append(raw_message_bytes)
+            self._send_queue_bytes += len(raw_message_bytes)
+            self.send_stats.add(len(raw_message_bytes), len(self._send_queue), self._send_queue_bytes)
+            # While paused, resume_writing() flushes
+            if self._send_scheduled or self._writing_paused:
                 return
-            if self._transport.is_closing():
+            self._send_scheduled = True
+        self._loop.call_soon_threadsafe(self._flush_send_queue)
+
+    def _send_queue_writable(self, limit):
+        return not self._send_queue or self._send_queue_bytes < limit
+
+    def _flush_send_queue(self):
+        """Write all queued messages in order. Runs on the connection's event loop."""
+        with self._send_queue_cond:
+            # Messages queued from here on schedule another flush
+            self._send_scheduled = False
+            if self._writing_paused or not self._send_queue:
                 return
-            self._transport.write(raw_message_bytes)
-        NetworkThread.network_event_loop.call_soon_threadsafe(maybe_write)
+            data = list(self._send_queue)
+            self._send_queue.clear()
+            self._send_queue_bytes = 0
+            self.send_stats.writes += 1
+            self._send_queue_cond.notify_all()
+        if self._transport and not self._transport.is_closing():
+            # May call pause_writing() before returning
+            self._transport.writelines(data)
+        self._wake_drain_waiters()
+
+    def _wake_drain_waiters(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def pause_writing(self):
+        """asyncio callback when the transport buffer goes over send_buffer_high_water."""
+        with self._send_queue_cond:
+            self._writing_paused = True
+            self.send_stats.pauses += 1
+
+    def resume_writing(self):
+        """asyncio callback when the transport buffer drained below its low-water mark."""
+        with self._send_queue_cond:
+            self._writing_paused = False
+        self._flush_send_queue()
 
     # Class utility methods
 
@@ -592,13 +785,17 @@ class P2PInterface(P2PConnection):
 
     # Connection helper methods
 
-    def wait_until(self, test_function_in, *, timeout=60, check_connected=True, check_interval=0.05):
+    def wait_until(self, test_function_in, *, timeout=60, check_connected=True, check_interval=None):
+        """Wait for the predicate, re-checking it whenever a connection received data.
+
+        It is also re-checked every check_interval (MAX_CHECK_INTERVAL by default),
+        for predicates on state the network thread does not change."""
         def test_function():
             if check_connected:
                 assert self.is_connected
             return test_function_in()
 
-        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor, check_interval=check_interval)
+        wait_until_helper_internal(test_function, timeout=timeout, lock=p2p_lock, timeout_factor=self.timeout_factor, check_interval=check_interval, changes=p2p_state_changes)
 
     def wait_for_connect(self, *, timeout=60):
         test_function = lambda: self.is_connected
@@ -723,34 +920,111 @@ class P2PInterface(P2PConnection):
 # This lock should be acquired in the thread running the test logic to synchronize
 # access to any data shared with the P2PInterface or P2PConnection.
 p2p_lock = threading.Lock()
+# Notified by every P2PConnection after it read data, connected or disconnected,
+# which is when the result of a P2PInterface.wait_until() predicate can change.
+p2p_state_changes = StateChanges()
+
+
+class LoopLagStats:
+    """How late an event loop runs callbacks, sampled by a timer every LOOP_LAG_INTERVAL.
+    A busy loop delays every connection on it by about this much."""
+    def __init__(self):
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    def add(self, lag):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_lag = lag
+
+    def to_dict(self):
+        return {
+            "samples": self.samples,
+            "avg_lag_ms": 1000 * self.total_lag / self.samples if self.samples else 0.0,
+            "max_lag_ms": 1000 * self.max_lag,
+            "last_lag_ms": 1000 * self.last_lag,
+        }
+
+
+# Seconds between the timers that measure event loop lag
+LOOP_LAG_INTERVAL = 0.1
 
 
 class NetworkThread(threading.Thread):
     network_event_loop = None
+    # All event loops, network_event_loop first. Outbound connections are
+    # spread over them round-robin, listening servers and so inbound
+    # connections stay on network_event_loop.
+    network_event_loops = []
+    loop_stats = []
 
-    def __init__(self):
+    def __init__(self, num_loops=1):
         super().__init__(name="NetworkThread")
-        # There is only one event loop and no more than one thread must be created
+        # There is only one set of event loops and no more than one NetworkThread must be created
         assert not self.network_event_loop
+        assert num_loops >= 1
 
         NetworkThread.listeners = {}
         NetworkThread.protos = {}
         if platform.system() == 'Windows':
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        NetworkThread.network_event_loop = asyncio.new_event_loop()
+        NetworkThread.network_event_loops = [asyncio.new_event_loop() for _ in range(num_loops)]
+        NetworkThread.network_event_loop = NetworkThread.network_event_loops[0]
+        NetworkThread.loop_stats = [LoopLagStats() for _ in range(num_loops)]
+        NetworkThread._loop_counter = itertools.count()
+        # This thread runs the first loop, the others get a thread each
+        self.loop_threads = [
+            threading.Thread(target=self._run_loop, args=(i,), name=f"NetworkThread-{i}", daemon=True)
+            for i in range(1, num_loops)
+        ]
 
     def run(self):
         """Start the network thread."""
-        self.network_event_loop.run_forever()
+        for thread in self.loop_threads:
+            thread.start()
+        self._run_loop(0)
+
+    @classmethod
+    def _run_loop(cls, index):
+        loop = cls.network_event_loops[index]
+        stats = cls.loop_stats[index]
+
+        def measure_lag(due):
+            now = loop.time()
+            stats.add(max(0.0, now - due))
+            loop.call_at(now + LOOP_LAG_INTERVAL, measure_lag, now + LOOP_LAG_INTERVAL)
+
+        measure_lag(loop.time())
+        loop.run_forever()
+
+    @classmethod
+    def next_event_loop(cls):
+        """Return the event loop for a new outbound connection."""
+        loops = cls.network_event_loops
+        return loops[next(cls._loop_counter) % len(loops)]
+
+    @classmethod
+    def stats(cls):
+        """Return the lag statistics of every event loop, in network_event_loops order."""
+        return [stats.to_dict() for stats in cls.loop_stats]
 
     def close(self, *, timeout=10):
-        """Close the connections and network event loop."""
-        self.network_event_loop.call_soon_threadsafe(self.network_event_loop.stop)
-        wait_until_helper_internal(lambda: not self.network_event_loop.is_running(), timeout=timeout)
-        self.network_event_loop.close()
+        """Close the connections and network event loops."""
+        loops = self.network_event_loops
+        for loop in loops:
+            loop.call_soon_threadsafe(loop.stop)
+        wait_until_helper_internal(lambda: not any(loop.is_running() for loop in loops), timeout=timeout)
+        for loop in loops:
+            loop.close()
         self.join(timeout)
-        # Safe to remove event loop.
+        for thread in self.loop_threads:
+            thread.join(timeout)
+        # Safe to remove event loops.
         NetworkThread.network_event_loop = None
+        NetworkThread.network_event_loops = []
 
     @classmethod
     def listen(cls, p2p, callback, port=None, addr=None, idx=1):
@@ -955,3 +1229,152 @@ class P2PTxInvStore(P2PInterface):
         self.wait_until(lambda: set(self.tx_invs_received.keys()) == set([int(tx, 16) for tx in txns]), timeout=timeout)
         # Flush messages and wait for the getdatas to be processed
         self.sync_with_ping()
+
+
+class TestFrameworkP2P(unittest.TestCase):
+    class Recorder(P2PConnection):
+        def __init__(self):
+            super().__init__()
+            self.peer_connect_helper('0', 0, 'regtest', 1)
+            self.received = []
+
+        def on_message(self, message):
+            self.received.append(message)
+
+    def make_messages(self):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(i, i)) for i in range(3)]
+        tx.vout = [CTxOut(1000, bytes(22)) for _ in range(3000)]
+        block = CBlock()
+        block.vtx = [tx, tx]
+        return [msg_ping(nonce=1), msg_block(block), msg_tx(tx), msg_ping(nonce=2)]
+
+    def feed(self, receiver, wire, chunk):
+        buf = receiver.recvbuf
+        for i in range(0, len(wire), chunk):
+            receiver.data_received(wire[i:i + chunk])
+        # No view of the receive buffer outlived its message, so it was never replaced
+        self.assertTrue(receiver.recvbuf is buf, "receive buffer was pinned by a view and replaced")
+        self.assertLessEqual(len(receiver.recvbuf), 2 * len(wire))
+
+    def check_received(self, receiver, messages):
+        self.assertEqual([m.serialize() for m in receiver.received], [m.serialize() for m in messages])
+
+    def test_v1_recvbuf(self):
+        messages = self.make_messages()
+        for lazy in (False, True):
+            sender, receiver = self.Recorder(), self.Recorder()
+            receiver.lazy_messages = lazy
+            wire = b"".join(sender.build_message(m) for m in messages)
+            self.feed(receiver, wire, 1000)
+            self.check_received(receiver, messages)
+            self.assertEqual(receiver.recv_offset, len(receiver.recvbuf))
+
+    def test_v2_recvbuf(self):
+        messages = self.make_messages()
+        for lazy in (False, True):
+            sender, receiver = self.Recorder(), self.Recorder()
+            receiver.lazy_messages = lazy
+            sender.v2_state = EncryptedP2PState(initiating=True, net='regtest')
+            receiver.v2_state = EncryptedP2PState(initiating=False, net='regtest')
+            for state in (sender.v2_state, receiver.v2_state):
+                state.initialize_v2_transport(bytes(32))
+                state.tried_v2_handshake = True
+            wire = b"".join(sender.build_message(m) for m in messages)
+            self.feed(receiver, wire, 999)
+            self.check_received(receiver, messages)
+
+    def start_network_thread(self, num_loops):
+        network_thread = NetworkThread(num_loops=num_loops)
+        network_thread.start()
+
+        def close():
+            for listener in NetworkThread.listeners.values():
+                NetworkThread.network_event_loop.call_soon_threadsafe(listener.close)
+            network_thread.close()
+        self.addCleanup(close)
+
+    def connect_pair(self, sender, receiver):
+        """Connect sender to receiver over loopback and wait for the version handshake."""
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        receiver.peer_connect_helper('0', 0, 'regtest', 1)
+        listening = threading.Event()
+        NetworkThread.listen(receiver, lambda addr, port: listening.set(), port=port)
+        self.assertTrue(listening.wait(10))
+        sender.peer_connect(dstaddr='127.0.0.1', dstport=port, net='regtest', timeout_factor=1,
+                            supports_v2_p2p=False, send_version=True)()
+        sender.wait_until(lambda: sender.is_connected, check_connected=False, timeout=10)
+        sender.wait_for_verack(timeout=10)
+
+    def disconnect_pair(self, sender, receiver):
+        sender.peer_disconnect()
+        receiver.wait_until(lambda: not receiver.is_connected, check_connected=False, timeout=10)
+        sender.wait_until(lambda: not sender.is_connected, check_connected=False, timeout=10)
+
+    def test_network_thread_loops(self):
+        class PingRecorder(P2PInterface):
+            def on_ping(self, message):
+                self.pings.append(message.nonce)
+                super().on_ping(message)
+
+        self.start_network_thread(2)
+        senders = []
+        for _ in range(2):
+            sender, receiver = P2PInterface(), PingRecorder()
+            receiver.pings = []
+            self.connect_pair(sender, receiver)
+            senders.append((sender, receiver))
+        # Outbound connections went to different loops
+        self.assertEqual([s._loop for s, _ in senders], NetworkThread.network_event_loops)
+
+        def send_pings(sender):
+            for nonce in range(500):
+                sender.send_without_ping(msg_ping(nonce=nonce))
+        threads = [threading.Thread(target=send_pings, args=(s,)) for s, _ in senders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for sender, receiver in senders:
+            sender.wait_until(lambda: sender.message_count["pong"] == 500, timeout=10)
+            self.assertEqual(receiver.pings, list(range(500)))
+            # Bursts of sends were coalesced into fewer writes
+            stats = sender.send_queue_stats()
+            self.assertLess(stats["writes"], stats["messages"])
+        stats = NetworkThread.stats()
+        self.assertEqual(len(stats), 2)
+        self.assertTrue(all(s["samples"] > 0 for s in stats))
+        for sender, receiver in senders:
+            self.disconnect_pair(sender, receiver)
+
+    def test_send_backpressure(self):
+        self.start_network_thread(1)
+        sender, receiver = P2PInterface(), P2PInterface()
+        sender.send_buffer_high_water = 1 << 16
+        receiver.lazy_messages = True
+        self.connect_pair(sender, receiver)
+        # A receiver that stops reading fills the socket buffers, then the transport buffer
+        reading = threading.Event()
+        receiver._loop.call_soon_threadsafe(lambda: (receiver._transport.pause_reading(), reading.set()))
+        self.assertTrue(reading.wait(10))
+        tx = CTransaction()
+        tx.vout = [CTxOut(1000, bytes(22)) for _ in range(3000)]
+        message = msg_tx(tx)
+        size = len(sender.build_message(message))
+        sent = 0
+        with self.assertRaises(AssertionError):
+            for _ in range(2000):
+                sender.send_blocking(message, timeout=1)
+                sent += 1
+        stats = sender.send_queue_stats()
+        self.assertTrue(stats["writing_paused"])
+        self.assertGreater(stats["pauses"], 0)
+        self.assertGreaterEqual(stats["queued_bytes"], SEND_QUEUE_LIMIT)
+        self.assertLess(stats["queued_bytes"], SEND_QUEUE_LIMIT + size)
+        # Everything queued arrives once the receiver reads again
+        receiver._loop.call_soon_threadsafe(receiver._transport.resume_reading)
+        receiver.wait_until(lambda: receiver.message_count["tx"] == sent, timeout=30)
+        self.assertFalse(sender.send_queue_stats()["writing_paused"])
+        self.disconnect_pair(sender, receiver)
@@ -27,7 +27,7 @@ from .address import create_deterministic_address_bcrt1_p2tr_op_true
 from .authproxy import JSONRPCException
 from . import coverage
 from .p2p import NetworkThread
-from .test_node import TestNode
+from .test_node import TestNode, node_state_changes
 from .util import (
     MAX_NODES,
     PortSeed,
@@ -366,6 +366,8 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
 
         self.log.debug('Closing down network thread')
         self.network_thread.close()
+        for node in self.nodes:
+            node.stop_tip_watcher()
         if self.success == TestStatus.FAILED:
             self.log.info("Not stopping nodes as test failed. The dangling processes will be cleaned up later.")
         else:
@@ -829,8 +831,16 @@ class BitcoinTestFramework(metaclass=BitcoinTestMetaClass):
         self.sync_blocks(nodes)
         self.sync_mempools(nodes)
 
-    def wait_until(self, test_function, timeout=60, check_interval=0.05):
-        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.options.timeout_factor, check_interval=check_interval)
+    def wait_until(self, test_function, timeout=60, check_interval=0.05, backoff=False, nodes=()):
+        """Wait for the predicate, re-checking it right away when any node has a new tip.
+
+        Tip watchers are only started for the given nodes, so pass the nodes
+        whose chain the predicate depends on. backoff=True spaces out checks
+        of an expensive predicate, at the cost of noticing changes that are
+        not a new tip up to MAX_CHECK_INTERVAL later."""
+        for node in nodes:
+            node.start_tip_watcher()
+        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.options.timeout_factor, check_interval=check_interval, changes=node_state_changes, backoff=backoff)
 
     # Private helper methods. These should not be accessed by the subclass test scripts.
 
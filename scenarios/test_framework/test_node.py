@@ -16,6 +16,7 @@ import platform
 import re
 import subprocess
 import tempfile
+import threading
 import time
 import urllib.parse
 import collections
@@ -39,6 +40,7 @@ from .util import (
     get_auth_cookie,
     get_rpc_proxy,
     rpc_url,
+    StateChanges,
     wait_until_helper_internal,
     p2p_port,
     tor_port,
@@ -77,6 +79,54 @@ class ErrorMatch(Enum):
     PARTIAL_REGEX = 3
 
 
+# Notified by every TipWatcher when its node's chain tip moves, see TestNode.wait_until()
+node_state_changes = StateChanges()
+# Seconds a waitfornewblock long poll may block before TipWatcher issues the next one
+TIP_WATCH_TIMEOUT = 30
+# Returned by nodes that do not have waitfornewblock
+RPC_METHOD_NOT_FOUND = -32601
+
+
+class TipWatcher(threading.Thread):
+    """Long polls a node with waitfornewblock on its own RPC connection and
+    notifies node_state_changes whenever the node has a new tip.
+
+    One RPC in flight per node, instead of every waiter repeating its
+    predicate, wakes the waiters on the event most RPC predicates wait for."""
+    def __init__(self, node):
+        super().__init__(name=f"TipWatcher-{node.index}", daemon=True)
+        self.log = node.log
+        self.rpc = get_rpc_proxy(node._rpc.rpc_url, node.index, timeout=TIP_WATCH_TIMEOUT + node.rpc_timeout)
+        # Set when the node does not have waitfornewblock, so there is no point in restarting
+        self.unsupported = False
+        self.stopping = threading.Event()
+
+    def stop(self):
+        """Exit once the long poll in flight returns, which is right away when the node stops."""
+        self.stopping.set()
+
+    def run(self):
+        tip = None
+        while not self.stopping.is_set():
+            try:
+                new_tip = self.rpc.waitfornewblock(1000 * TIP_WATCH_TIMEOUT)["hash"]
+            except JSONRPCException as e:
+                if e.error["code"] == RPC_METHOD_NOT_FOUND:
+                    self.unsupported = True
+                    self.log.debug(f"Not watching the chain tip: {e.error}")
+                    return
+                # e.g. still warming up, try again
+                self.stopping.wait(1)
+                continue
+            except Exception as e:
+                # The node went away, the next wait_until that watches the tip starts a new one
+                self.log.debug(f"Stopped watching the chain tip: {e!r}")
+                return
+            if new_tip != tip:
+                tip = new_tip
+                node_state_changes.notify()
+
+
 class TestNode():
     """A class for representing a bitcoind node under test.
 
@@ -191,6 +241,7 @@ class TestNode():
 
         self.p2ps = []
         self.timeout_factor = timeout_factor
+        self.tip_watcher = None
 
         self.mocktime = None
 
@@ -440,6 +491,7 @@ class TestNode():
             "Should only call stop_node() on a running node after wait_for_rpc_connection() succeeded. "
             f"Did you forget to call the latter after start()? Not connected to process: {self.process.pid}")
         self.log.debug("Stopping node")
+        self.stop_tip_watcher()
         # Do not use wait argument when testing older nodes, e.g. in wallet_backwards_compatibility.py
         if self.version_is_at_least(180000):
             self.stop(wait=wait)
@@ -890,8 +942,29 @@ class TestNode():
         self.mocktime += seconds
         self.setmocktime(self.mocktime)
 
-    def wait_until(self, test_function, timeout=60, check_interval=0.05):
-        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.timeout_factor, check_interval=check_interval)
+    def start_tip_watcher(self):
+        """Start a TipWatcher for this node unless one is running or the node can't have one."""
+        watcher = self.tip_watcher
+        if watcher and (watcher.unsupported or (watcher.is_alive() and not watcher.stopping.is_set())):
+            return
+        if not self.rpc_connected or self._rpc is None:
+            return
+        self.tip_watcher = TipWatcher(self)
+        self.tip_watcher.start()
+
+    def stop_tip_watcher(self):
+        if self.tip_watcher:
+            self.tip_watcher.stop()
+
+    def wait_until(self, test_function, timeout=60, check_interval=0.05, backoff=False, watch_tip=False):
+        """Wait for the predicate, re-checking it right away when any node has a new tip.
+
+        watch_tip=True starts a TipWatcher for this node, for predicates on its
+        chain. backoff=True spaces out checks of an expensive predicate, see
+        BitcoinTestFramework.wait_until()."""
+        if watch_tip:
+            self.start_tip_watcher()
+        return wait_until_helper_internal(test_function, timeout=timeout, timeout_factor=self.timeout_factor, check_interval=check_interval, changes=node_state_changes, backoff=backoff)
 
 
 class TestNodeCLIAttr:
@@ -16,7 +16,9 @@ import pathlib
 import platform
 import random
 import re
+import threading
 import time
+import unittest
 
 from . import coverage
 from .authproxy import AuthServiceProxy, JSONRPCException
@@ -293,9 +295,40 @@ def ensure_for(*, duration, f, check_interval=0.2):
         time.sleep(check_interval)
 
 
-def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_factor=1.0, check_interval=0.05):
+# Longest pause between two checks of a predicate that is waiting on StateChanges
+# or backing off, for changes nothing announces
+MAX_CHECK_INTERVAL = 0.5
+
+
+class StateChanges:
+    """A counter producers bump whenever state that waiters may be polling changed.
+
+    Waiters read `version` before evaluating their predicate and then wait() for it
+    to move on, so a change that lands in between still wakes them."""
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+
+    def notify(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, version, timeout):
+        """Wait up to timeout seconds for a notify() after version was read. Return whether one came."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version != version, timeout)
+
+
+def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_factor=1.0, check_interval=0.05, changes=None, backoff=False):
     """Sleep until the predicate resolves to be True.
 
+    With changes, a StateChanges instance, the predicate is re-checked as soon as
+    a producer notifies it, and otherwise every check_interval, which can then be
+    None for MAX_CHECK_INTERVAL. With backoff, the interval doubles after every
+    check up to MAX_CHECK_INTERVAL, which spares the node when the predicate
+    makes RPC calls, and starts over from check_interval after a notification.
+
     Warning: Note that this method is not recommended to be used in tests as it is
     not aware of the context of the test framework. Using the `wait_until()` members
     from `BitcoinTestFramework` or `P2PInterface` class ensures the timeout is
@@ -304,8 +337,12 @@ def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_fact
     """
     timeout = timeout * timeout_factor
     time_end = time.time() + timeout
+    if check_interval is None:
+        check_interval = MAX_CHECK_INTERVAL
+    interval = check_interval
 
     while time.time() < time_end:
+        version = changes.version if changes else None
         if lock:
             with lock:
                 if predicate():
@@ -313,7 +350,13 @@ def wait_until_helper_internal(predicate, *, timeout=60, lock=None, timeout_fact
         else:
             if predicate():
                 return
-        time.sleep(check_interval)
+        notified = False
+        if changes:
+            notified = changes.wait(version, max(0.0, min(interval, time_end - time.time())))
+        else:
+            time.sleep(interval)
+        if backoff:
+            interval = check_interval if notified else min(2 * interval, max(check_interval, MAX_CHECK_INTERVAL))
 
     # Print the cause of the timeout
     predicate_source = "''''\n" + inspect.getsource(predicate) + "'''"
@@ -619,3 +662,29 @@ def wallet_importprivkey(wallet_rpc, privkey, timestamp, *, label=""):
     }]
     import_res = wallet_rpc.importdescriptors(req)
     assert_equal(import_res[0]["success"], True)
+
+
+class TestFrameworkUtil(unittest.TestCase):
+    def test_wait_until_changes(self):
+        changes = StateChanges()
+        state = []
+
+        def produce():
+            time.sleep(0.1)
+            state.append(1)
+            changes.notify()
+        thread = threading.Thread(target=produce)
+        thread.start()
+        start = time.time()
+        # Without the notification this would only re-check after 30 seconds
+        wait_until_helper_internal(lambda: state, timeout=10, check_interval=30, changes=changes)
+        self.assertLess(time.time() - start, 5)
+        thread.join()
+
+    def test_wait_until_backoff(self):
+        checks = []
+        with self.assertRaises(AssertionError):
+            wait_until_helper_internal(lambda: checks.append(time.time()), timeout=2, backoff=True)
+        # 0.05, 0.1, 0.2, 0.4, then every MAX_CHECK_INTERVAL instead of 40 checks
+        self.assertLess(len(checks), 10)
+        self.assertGreater(len(checks), 3)
@@ -249,35 +249,40 @@ class EncryptedP2PState:
         """Encrypt a BIP324 packet.
 
         Returns:
-        bytes - encrypted packet contents
+        bytearray - encrypted packet contents
         """
         assert len(contents) <= 2**24 - 1
         header = (ignore << IGNORE_BIT_POS).to_bytes(HEADER_LEN, 'little')
         plaintext = header + contents
-        aead_ciphertext = self.peer['send_P'].encrypt(aad, plaintext)
-        enc_plaintext_len = self.peer['send_L'].crypt(len(contents).to_bytes(LENGTH_FIELD_LEN, 'little'))
-        return enc_plaintext_len + aead_ciphertext
+        # Encrypt straight into the packet instead of concatenating length and ciphertext
+        packet = bytearray(LENGTH_FIELD_LEN + len(plaintext) + CHACHA20POLY1305_EXPANSION)
+        self.peer['send_P'].encrypt_into(aad, plaintext, memoryview(packet)[LENGTH_FIELD_LEN:])
+        packet[:LENGTH_FIELD_LEN] = self.peer['send_L'].crypt(len(contents).to_bytes(LENGTH_FIELD_LEN, 'little'))
+        return packet
 
     def v2_receive_packet(self, response, aad=b''):
         """Decrypt a BIP324 packet
 
+        response may be any bytes-like object, it is sliced through a memoryview without copying.
+
         Returns:
         1. int - number of bytes consumed (or -1 if error)
-        2. bytes - contents of decrypted non-decoy packet if any (or None otherwise)
+        2. memoryview - contents of decrypted non-decoy packet if any (or None otherwise)
         """
+        response = memoryview(response)
         if self.contents_len == -1:
             if len(response) < LENGTH_FIELD_LEN:
                 return 0, None
             enc_contents_len = response[:LENGTH_FIELD_LEN]
             self.contents_len = int.from_bytes(self.peer['recv_L'].crypt(enc_contents_len), 'little')
-        response = response[LENGTH_FIELD_LEN:]
-        if len(response) < HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION:
+        length = LENGTH_FIELD_LEN + HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION
+        if len(response) < length:
             return 0, None
-        aead_ciphertext = response[:HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION]
-        plaintext = self.peer['recv_P'].decrypt(aad, aead_ciphertext)
+        plaintext = self.peer['recv_P'].decrypt(aad, response[LENGTH_FIELD_LEN:length])
         if plaintext is None:
             return -1, None  # disconnect
-        header = plaintext[:HEADER_LEN]
-        length = LENGTH_FIELD_LEN + HEADER_LEN + self.contents_len + CHACHA20POLY1305_EXPANSION
         self.contents_len = -1
-        return length, None if (header[0] & (1 << IGNORE_BIT_POS)) else plaintext[HEADER_LEN:]
+        if plaintext[0] & (1 << IGNORE_BIT_POS):
+            return length, None
+        # A view of the decrypted bytes, which do not alias the caller's buffer
+        return length, memoryview(plaintext)[HEADER_LEN:]
@@ -4,13 +4,17 @@
 # file COPYING or http://www.opensource.org/licenses/mit-license.php.
 """A limited-functionality wallet, which may replace a real wallet in tests"""
 
+from bisect import bisect_left, insort
 from copy import deepcopy
 from decimal import Decimal
 from enum import Enum
+import logging
+import time
 from typing import (
     Any,
     Optional,
 )
+import unittest
 from test_framework.address import (
     address_to_scriptpubkey,
     create_deterministic_address_bcrt1_p2tr_op_true,
@@ -19,6 +23,7 @@ from test_framework.address import (
     key_to_p2wpkh,
     output_key_to_p2tr,
 )
+from test_framework.authproxy import JSONRPCException
 from test_framework.blocktools import COINBASE_MATURITY
 from test_framework.descriptors import descsum_create
 from test_framework.key import (
@@ -58,6 +63,24 @@ from test_framework.wallet_util import generate_keypair
 
 DEFAULT_FEE = Decimal("0.0001")
 
+# Number of calls sent per JSON-RPC batch by rescan_utxos and send_txs
+RPC_BATCH_SIZE = 500
+
+# RPC_INVALID_ADDRESS_OR_KEY, returned for txs that left the mempool mid-rescan
+RPC_NOT_FOUND = -5
+
+logger = logging.getLogger("TestFramework.wallet")
+
+
+def _batch_error(response):
+    """Return the error dict of a batch response, or None. Over RPC the
+    error is a dict, with use_cli it is the raised JSONRPCException."""
+    error = response.get("error")
+    if isinstance(error, JSONRPCException):
+        return error.error
+    return error
+
+
 class MiniWalletMode(Enum):
     """Determines the transaction type the MiniWallet is creating and spending.
 
@@ -84,10 +107,76 @@ class MiniWalletMode(Enum):
     RAW_P2PK = 3
 
 
+class UTXOSet:
+    """The MiniWallet's utxo dicts, indexed by outpoint and txid and kept
+    ordered by (value, -height), so lookups, spends and largest-first
+    selection don't have to scan or re-sort the whole set."""
+    __slots__ = ("_by_outpoint", "_by_txid", "_ordered", "_seq", "balance")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._by_outpoint = {}
+        self._by_txid = {}
+        # (value, -height, insertion order, txid, vout), smallest first. The
+        # insertion order breaks ties in favour of the most recently added utxo.
+        self._ordered = []
+        self._seq = 0
+        self.balance = 0
+
+    def __len__(self):
+        return len(self._by_outpoint)
+
+    def __iter__(self):
+        """Iterate from the smallest to the largest utxo"""
+        by_outpoint = self._by_outpoint
+        return (by_outpoint[entry[3:]][1] for entry in self._ordered)
+
+    def __reversed__(self):
+        by_outpoint = self._by_outpoint
+        return (by_outpoint[entry[3:]][1] for entry in reversed(self._ordered))
+
+    def add(self, utxo):
+        """Add a utxo, replacing any utxo with the same outpoint"""
+        outpoint = (utxo["txid"], utxo["vout"])
+        self.remove(*outpoint)
+        entry = (utxo["value"], -utxo["height"], self._seq) + outpoint
+        self._seq += 1
+        insort(self._ordered, entry)
+        self._by_outpoint[outpoint] = (entry, utxo)
+        self._by_txid.setdefault(outpoint[0], set()).add(outpoint[1])
+        self.balance += utxo["value"]
+
+    def get(self, txid, vout):
+        """Return the utxo at the outpoint, or None"""
+        item = self._by_outpoint.get((txid, vout))
+        return item[1] if item else None
+
+    def with_txid(self, txid):
+        """Return the utxos of a transaction from the smallest to the largest"""
+        items = [self._by_outpoint[(txid, vout)] for vout in self._by_txid.get(txid, ())]
+        return [utxo for _, utxo in sorted(items, key=lambda item: item[0])]
+
+    def remove(self, txid, vout):
+        """Remove and return the utxo at the outpoint, or None if there is none"""
+        item = self._by_outpoint.pop((txid, vout), None)
+        if item is None:
+            return None
+        entry, utxo = item
+        del self._ordered[bisect_left(self._ordered, entry)]
+        vouts = self._by_txid[txid]
+        vouts.discard(vout)
+        if not vouts:
+            del self._by_txid[txid]
+        self.balance -= utxo["value"]
+        return utxo
+
+
 class MiniWallet:
     def __init__(self, test_node, *, mode=MiniWalletMode.ADDRESS_OP_TRUE, tag_name=None):
         self._test_node = test_node
-        self._utxos = []
+        self._utxos = UTXOSet()
         self._mode = mode
 
         assert isinstance(mode, MiniWalletMode)
@@ -125,15 +214,15 @@ class MiniWallet:
 
 
     def get_balance(self):
-        return sum(u['value'] for u in self._utxos)
+        return self._utxos.balance
 
     def rescan_utxos(self, *, include_mempool=True):
         """Drop all utxos and rescan the utxo set"""
-        self._utxos = []
+        self._utxos.clear()
         res = self._test_node.scantxoutset(action="start", scanobjects=[self.get_descriptor()])
         assert_equal(True, res['success'])
         for utxo in res['unspents']:
-            self._utxos.append(
+            self._utxos.add(
                 self._create_utxo(txid=utxo["txid"],
                                   vout=utxo["vout"],
                                   value=utxo["amount"],
@@ -141,11 +230,32 @@ class MiniWallet:
                                   coinbase=utxo["coinbase"],
                                   confirmations=res["height"] - utxo["height"] + 1))
         if include_mempool:
+            start = time.perf_counter()
             mempool = self._test_node.getrawmempool(verbose=True)
             # Sort tx by ancestor count. See BlockAssembler::SortForBlock in src/node/miner.cpp
             sorted_mempool = sorted(mempool.items(), key=lambda item: (item[1]["ancestorcount"], int(item[0], 16)))
-            for txid, _ in sorted_mempool:
-                self.scan_tx(self._test_node.getrawtransaction(txid=txid, verbose=True))
+            txs = self._get_raw_transactions([txid for txid, _ in sorted_mempool])
+            self.scan_txs(txs)
+            logger.debug(f"Rescanned {len(txs)} mempool txs in {time.perf_counter() - start:.3f}s, "
+                         f"{len(self._utxos)} utxos")
+
+    def _get_raw_transactions(self, txids):
+        """Fetch decoded transactions with batched getrawtransaction calls,
+        skipping any that are no longer in the mempool"""
+        txs = []
+        for i in range(0, len(txids), RPC_BATCH_SIZE):
+            requests = [self._test_node.getrawtransaction.get_request(txid=txid, verbose=True)
+                        for txid in txids[i:i + RPC_BATCH_SIZE]]
+            # Responses are matched by position: with use_cli the batch is run
+            # call by call and the responses carry no id.
+            for response in self._test_node.batch(requests):
+                error = _batch_error(response)
+                if error:
+                    if error["code"] == RPC_NOT_FOUND:
+                        continue
+                    raise JSONRPCException(error)
+                txs.append(response["result"])
+        return txs
 
     def scan_tx(self, tx):
         """Scan the tx and adjust the internal list of owned utxos"""
@@ -154,17 +264,36 @@ class MiniWallet:
             # utxo that remained in this wallet. For example, by passing
             # mark_as_spent=False to get_utxo or by using an utxo returned by a
             # create_self_transfer* call.
-            try:
-                self.get_utxo(txid=spent["txid"], vout=spent["vout"])
-            except StopIteration:
-                pass
+            self._utxos.remove(spent["txid"], spent["vout"])
+        spk_hex = self._scriptPubKey.hex()
         for out in tx['vout']:
-            if out['scriptPubKey']['hex'] == self._scriptPubKey.hex():
-                self._utxos.append(self._create_utxo(txid=tx["txid"], vout=out["n"], value=out["value"], height=0, coinbase=False, confirmations=0))
+            if out['scriptPubKey']['hex'] == spk_hex:
+                self._utxos.add(self._create_utxo(txid=tx["txid"], vout=out["n"], value=out["value"], height=0, coinbase=False, confirmations=0))
+
+    def _scan_created_txs(self, txs):
+        """Like scan_txs, for txs returned by the create_* methods, which
+        saves decoding them through the node"""
+        spent = {(f"{txin.prevout.hash:064x}", txin.prevout.n) for t in txs for txin in t["tx"].vin}
+        for outpoint in spent:
+            self._utxos.remove(*outpoint)
+        for t in txs:
+            tx = t["tx"]
+            txid = tx.txid_hex
+            for n, out in enumerate(tx.vout):
+                if out.scriptPubKey == self._scriptPubKey and (txid, n) not in spent:
+                    self._utxos.add(self._create_utxo(txid=txid, vout=n, value=Decimal(out.nValue) / COIN, height=0, coinbase=False, confirmations=0))
 
     def scan_txs(self, txs):
+        """Scan many txs in one pass. Outputs spent by any of the txs are never
+        added, so the txs don't need to be in dependency order."""
+        spent = {(vin["txid"], vin["vout"]) for tx in txs for vin in tx["vin"] if "txid" in vin}
+        for outpoint in spent:
+            self._utxos.remove(*outpoint)
+        spk_hex = self._scriptPubKey.hex()
         for tx in txs:
-            self.scan_tx(tx)
+            for out in tx['vout']:
+                if out['scriptPubKey']['hex'] == spk_hex and (tx["txid"], out["n"]) not in spent:
+                    self._utxos.add(self._create_utxo(txid=tx["txid"], vout=out["n"], value=out["value"], height=0, coinbase=False, confirmations=0))
 
     def sign_tx(self, tx, fixed_length=True):
         if self._mode == MiniWalletMode.RAW_P2PK:
@@ -223,35 +352,45 @@ class MiniWallet:
         Args:
         txid: get the first utxo we find from a specific transaction
         """
-        self._utxos = sorted(self._utxos, key=lambda k: (k['value'], -k['height']))  # Put the largest utxo last
-        blocks_height = self._test_node.getblockchaininfo()['blocks']
-        mature_coins = list(filter(lambda utxo: not utxo['coinbase'] or COINBASE_MATURITY - 1 <= blocks_height - utxo['height'], self._utxos))
-        if txid:
-            utxo_filter: Any = filter(lambda utxo: txid == utxo['txid'], self._utxos)
+        if txid and vout is not None:
+            utxo = self._utxos.get(txid, vout)
+            utxo_filter: Any = [utxo] if utxo else []
+        elif txid:
+            utxo_filter = self._utxos.with_txid(txid)
         else:
-            utxo_filter = reversed(mature_coins)  # By default the largest utxo
-        if vout is not None:
-            utxo_filter = filter(lambda utxo: vout == utxo['vout'], utxo_filter)
+            utxo_filter = self._mature(reversed(self._utxos))  # By default the largest utxo
+            if vout is not None:
+                utxo_filter = filter(lambda utxo: vout == utxo['vout'], utxo_filter)
         if confirmed_only:
             utxo_filter = filter(lambda utxo: utxo['confirmations'] > 0, utxo_filter)
-        index = self._utxos.index(next(utxo_filter))
+        utxo = next(iter(utxo_filter))
         if mark_as_spent:
-            return self._utxos.pop(index)
-        else:
-            return self._utxos[index]
+            self._utxos.remove(utxo['txid'], utxo['vout'])
+        return utxo
+
+    def _mature(self, utxos):
+        """Filter out immature coinbase utxos, only asking the node for the
+        block height once a coinbase utxo comes up"""
+        blocks_height = None
+        for utxo in utxos:
+            if utxo['coinbase']:
+                if blocks_height is None:
+                    blocks_height = self._test_node.getblockchaininfo()['blocks']
+                if COINBASE_MATURITY - 1 > blocks_height - utxo['height']:
+                    continue
+            yield utxo
 
     def get_utxos(self, *, include_immature_coinbase=False, mark_as_spent=True, confirmed_only=False):
         """Returns the list of all utxos and optionally mark them as spent"""
         if not include_immature_coinbase:
-            blocks_height = self._test_node.getblockchaininfo()['blocks']
-            utxo_filter = filter(lambda utxo: not utxo['coinbase'] or COINBASE_MATURITY - 1 <= blocks_height - utxo['height'], self._utxos)
+            utxo_filter: Any = self._mature(self._utxos)
         else:
             utxo_filter = self._utxos
         if confirmed_only:
             utxo_filter = filter(lambda utxo: utxo['confirmations'] > 0, utxo_filter)
         utxos = deepcopy(list(utxo_filter))
         if mark_as_spent:
-            self._utxos = []
+            self._utxos.clear()
         return utxos
 
     def send_self_transfer(self, *, from_node, **kwargs):
@@ -414,10 +553,66 @@ class MiniWallet:
         Returns a list of objects for each tx (see create_self_transfer_multi).
         """
         chain = self.create_self_transfer_chain(**kwargs)
-        for t in chain:
-            self.sendrawtransaction(from_node=from_node, tx_hex=t["hex"])
+        self.send_txs(from_node=from_node, txs=chain)
         return chain
 
+    def create_self_transfer_fan_out(self, *, num_children, utxo_to_spend=None, **kwargs):
+        """
+        Create a parent transaction with num_children outputs and a child
+        transaction spending each of them. Returns [parent] + children.
+        """
+        parent = self.create_self_transfer_multi(utxos_to_spend=[utxo_to_spend] if utxo_to_spend else None, num_outputs=num_children)
+        children = [self.create_self_transfer(utxo_to_spend=utxo, **kwargs) for utxo in parent["new_utxos"]]
+        return [parent] + children
+
+    def create_self_transfer_fan_in(self, *, num_parents, **kwargs):
+        """
+        Create num_parents transactions and a child transaction spending all
+        of their outputs. Returns parents + [child], which can be sent as a
+        package.
+        """
+        parents = [self.create_self_transfer() for _ in range(num_parents)]
+        child = self.create_self_transfer_multi(utxos_to_spend=[p["new_utxo"] for p in parents], **kwargs)
+        return parents + [child]
+
+    def send_txs(self, *, from_node, txs, maxfeerate=0, batch_size=RPC_BATCH_SIZE, progress=None):
+        """
+        Send txs returned by the create_* methods with batched sendrawtransaction
+        calls and return their txids. Parents must come before their children.
+
+        progress, if given, is called with (number of txs sent, total) after
+        every batch. Raises the first error of a batch after the txs that were
+        accepted have been scanned.
+        """
+        txids = []
+        for i in range(0, len(txs), batch_size):
+            batch = txs[i:i + batch_size]
+            requests = [from_node.sendrawtransaction.get_request(hexstring=t["hex"], maxfeerate=maxfeerate) for t in batch]
+            sent = []
+            errors = []
+            for t, response in zip(batch, from_node.batch(requests)):
+                error = _batch_error(response)
+                if error:
+                    errors.append(error)
+                else:
+                    sent.append(t)
+                    txids.append(response["result"])
+            self._scan_created_txs(sent)
+            if errors:
+                raise JSONRPCException(errors[0])
+            logger.debug(f"Sent {len(txids)}/{len(txs)} txs")
+            if progress:
+                progress(len(txids), len(txs))
+        return txids
+
+    def send_package(self, *, from_node, txs, **kwargs):
+        """Submit txs returned by the create_* methods as one package with
+        submitpackage, scan the accepted ones and return the RPC result."""
+        res = from_node.submitpackage([t["hex"] for t in txs], **kwargs)
+        results = res["tx-results"]
+        self._scan_created_txs([t for t in txs if t["wtxid"] in results and "error" not in results[t["wtxid"]]])
+        return res
+
 
 def getnewdestination(address_type='bech32m'):
     """Generate a random destination of the specified type and return the
@@ -443,3 +638,110 @@ def getnewdestination(address_type='bech32m'):
     else:
         assert False
     return pubkey, scriptpubkey, address
+
+
+class TestFrameworkWallet(unittest.TestCase):
+    def test_utxo_set(self):
+        def utxo(txid, vout, value, height=0):
+            return {"txid": txid, "vout": vout, "value": Decimal(value), "height": height,
+                    "coinbase": False, "confirmations": 0}
+
+        utxos = UTXOSet()
+        for u in [utxo("aa", 0, "1"), utxo("aa", 1, "3"), utxo("bb", 0, "3", 5), utxo("cc", 0, "3"), utxo("dd", 2, "0.5")]:
+            utxos.add(u)
+        self.assertEqual(len(utxos), 5)
+        self.assertEqual(utxos.balance, Decimal("10.5"))
+        # largest last, lower heights after higher ones, ties to the most recently added
+        self.assertEqual([(u["txid"], u["vout"]) for u in utxos], [("dd", 2), ("aa", 0), ("bb", 0), ("aa", 1), ("cc", 0)])
+        self.assertEqual(next(reversed(utxos))["txid"], "cc")
+        self.assertEqual([u["vout"] for u in utxos.with_txid("aa")], [0, 1])
+        self.assertEqual(utxos.get("bb", 0)["height"], 5)
+        self.assertIsNone(utxos.get("bb", 1))
+
+        self.assertEqual(utxos.remove("aa", 1)["value"], Decimal("3"))
+        self.assertIsNone(utxos.remove("aa", 1))
+        self.assertEqual([u["vout"] for u in utxos.with_txid("aa")], [0])
+        utxos.add(utxo("dd", 2, "2"))
+        self.assertEqual(len(utxos), 4)
+        self.assertEqual(utxos.balance, Decimal("9"))
+        self.assertEqual([u["txid"] for u in utxos], ["aa", "dd", "bb", "cc"])
+        utxos.clear()
+        self.assertEqual((len(utxos), utxos.balance, list(utxos)), (0, 0, []))
+
+    def test_rescan_mempool(self):
+        wallet_spk = bytes(CScript([OP_TRUE])).hex()
+
+        def tx(txid, spends, n_out):
+            return {"txid": txid, "vin": [{"txid": t, "vout": v} for t, v in spends],
+                    "vout": [{"n": n, "value": Decimal(1), "scriptPubKey": {"hex": wallet_spk}} for n in range(n_out)]}
+
+        # child before parent, plus one tx that leaves the mempool mid-rescan
+        mempool = {"0c": tx("0c", [("0a", 0)], 1), "0a": tx("0a", [("01", 0)], 2), "0d": tx("0d", [], 1)}
+
+        class Node:
+            class getrawtransaction:
+                @staticmethod
+                def get_request(txid, verbose):
+                    return {"id": txid, "params": [txid, verbose]}
+
+            def scantxoutset(self, **kwargs):
+                return {"success": True, "height": 10, "unspents": [
+                    {"txid": t, "vout": 0, "amount": Decimal(5), "height": 1, "coinbase": False} for t in ("01", "02")]}
+
+            def getrawmempool(self, verbose):
+                return {txid: {"ancestorcount": 1} for txid in mempool}
+
+            def batch(self, requests):
+                # use_cli style responses: no id, errors as exceptions
+                return [{"result": mempool[r["id"]]} if r["id"] != "0d" else
+                        {"error": JSONRPCException({"code": RPC_NOT_FOUND, "message": ""})}
+                        for r in requests]
+
+        wallet = MiniWallet(Node(), mode=MiniWalletMode.RAW_OP_TRUE)
+        self.assertEqual(sorted((u["txid"], u["vout"]) for u in wallet.get_utxos(mark_as_spent=False)),
+                         [("02", 0), ("0a", 1), ("0c", 0)])
+        self.assertEqual(wallet.get_balance(), Decimal(7))
+
+    def test_send_txs(self):
+        class Node:
+            def __init__(self):
+                self.batches = []
+
+            class sendrawtransaction:
+                @staticmethod
+                def get_request(hexstring, maxfeerate):
+                    return {"id": hexstring, "params": [hexstring, maxfeerate]}
+
+            def scantxoutset(self, **kwargs):
+                return {"success": True, "height": 10, "unspents": [
+                    {"txid": f"{i:064x}", "vout": 0, "amount": Decimal(50), "height": 1, "coinbase": False} for i in range(1, 4)]}
+
+            def getrawmempool(self, verbose):
+                return {}
+
+            def batch(self, requests):
+                self.batches.append(len(requests))
+                return [{"result": "00" * 32} for r in requests]
+
+        node = Node()
+        wallet = MiniWallet(node, mode=MiniWalletMode.RAW_OP_TRUE)
+        chain = wallet.create_self_transfer_chain(chain_length=5)
+        fan_out = wallet.create_self_transfer_fan_out(num_children=3)
+        fan_in = wallet.create_self_transfer_fan_in(num_parents=1)
+        self.assertEqual(len(wallet.get_utxos(mark_as_spent=False)), 0)
+        progress = []
+        wallet.send_txs(from_node=node, txs=chain + fan_out + fan_in, batch_size=4,
+                        progress=lambda sent, total: progress.append((sent, total)))
+        self.assertEqual(node.batches, [4, 4, 3])
+        self.assertEqual(progress, [(4, 11), (8, 11), (11, 11)])
+        # only the tips of the graph are left unspent
+        tips = {chain[-1]["txid"]} | {t["txid"] for t in fan_out[1:]} | {fan_in[-1]["txid"]}
+        self.assertEqual({u["txid"] for u in wallet.get_utxos(mark_as_spent=False)}, tips)
+
+        # use_cli style responses: no id, errors as exceptions
+        node.batch = lambda requests: [{"error": JSONRPCException({"code": -26, "message": "rejected"})} if i else
+                                       {"result": "00" * 32} for i in range(len(requests))]
+        chain = wallet.create_self_transfer_chain(chain_length=2)
+        with self.assertRaises(JSONRPCException):
+            wallet.send_txs(from_node=node, txs=chain)
+        self.assertIn(chain[0]["txid"], {u["txid"] for u in wallet.get_utxos(mark_as_spent=False)})
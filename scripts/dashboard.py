@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import copy
+import hashlib
+import json
+import os
+import re
+import sys
+import yaml
+from pathlib import Path
+
+ROOT = Path(os.path.dirname(__file__)) / ".."
+TEMPLATE_FILE = ROOT / "dashboards" / "wrath_of_nalo.json"
+DASHBOARD_UID = "wrath-of-nalo"
+
+# Node names written by fleet.py that belong to a team
+TEAM_NODE = re.compile(r"^(?P<team>[a-z]+)-(cb-)?(spender|router|recipient|gossip-vuln|onion-vuln)$")
+
+# Pre-aggregated series so Grafana does not evaluate the raw cAdvisor
+# regex over every container in the cluster on each refresh
+RECORDING_RULES = [
+    {
+        "record": "nalo:vuln_memory_usage_bytes",
+        "expr": 'max by (pod) (container_memory_usage_bytes{pod=~".*vuln-ln"})',
+    },
+]
+
+# (title, query, legend) for each panel in a team's row
+TEAM_PANELS = [
+    ("Failed Payments", 'failed_payments{{pod=~"{team}-(cb-)?spender-ln"}}', "{{pod}}"),
+    ("Pending HTLCs", 'pending_htlcs{{pod=~"{team}-(cb-)?router-ln"}}', "{{pod}}-{{scid}}"),
+    ("Channel Balance", 'lnd_balance_channels{{pod=~"{team}-(cb-)?recipient-ln"}}', "{{pod}}"),
+    ("Memory Usage", 'nalo:vuln_memory_usage_bytes{{pod=~"{team}-.*vuln-ln"}}', "{{pod}}"),
+]
+
+
+def game_teams(game):
+    with open(ROOT / "battlefields" / game / "network.yaml") as f:
+        network = yaml.safe_load(f)
+    teams = []
+    for node in network["nodes"]:
+        match = TEAM_NODE.match(node["name"])
+        if match and match["team"] not in teams:
+            teams.append(match["team"])
+    return teams
+
+
+def make_panel(template, panel_id, title, expr, legend, grid_pos):
+    panel = copy.deepcopy(template)
+    panel["id"] = panel_id
+    panel["title"] = title
+    panel["gridPos"] = grid_pos
+    panel["targets"] = [
+        {
+            "datasource": template["datasource"],
+            "editorMode": "code",
+            "expr": expr,
+            "legendFormat": legend,
+            "range": True,
+            "refId": "A",
+        }
+    ]
+    return panel
+
+
+def generate(game):
+    with open(TEMPLATE_FILE) as f:
+        dashboard = json.load(f)
+    # The first panel of the static dashboard supplies the look of every generated panel
+    template = dashboard["panels"][0]
+
+    panels = []
+    y = 0
+    panels.append(make_panel(template, 1, "Blockchain Height", "lnd_block_height", "{{pod}}",
+                             {"h": 5, "w": 24, "x": 0, "y": y}))
+    y += 5
+    for team in game_teams(game):
+        row_id = len(panels) + 1
+        row = {
+            "id": row_id,
+            "type": "row",
+            "title": team,
+            "collapsed": False,
+            "gridPos": {"h": 1, "w": 24, "x": 0, "y": y},
+            "panels": [],
+        }
+        panels.append(row)
+        y += 1
+        for i, (title, expr, legend) in enumerate(TEAM_PANELS):
+            grid_pos = {"h": 7, "w": 12, "x": 12 * (i % 2), "y": y + 7 * (i // 2)}
+            panels.append(make_panel(template, len(panels) + 1, f"{team}: {title}",
+                                     expr.format(team=team), legend, grid_pos))
+        y += 7 * ((len(TEAM_PANELS) + 1) // 2)
+
+    dashboard["uid"] = DASHBOARD_UID
+    dashboard["panels"] = panels
+    dashboard.pop("version", None)
+    dashboard["description"] = f"sha256:{dashboard_hash(dashboard)}"
+    return dashboard
+
+
+def dashboard_hash(dashboard):
+    content = {k: v for k, v in dashboard.items() if k not in ("description", "id", "version")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def recording_rules():
+    return {
+        "apiVersion": "monitoring.coreos.com/v1",
+        "kind": "PrometheusRule",
+        "metadata": {
+            "name": "wrath-of-nalo",
+            "namespace": "warnet-logging",
+            "labels": {"release": "prometheus"},
+        },
+        "spec": {
+            "groups": [
+                {
+                    "name": "wrath-of-nalo",
+                    "interval": "15s",
+                    "rules": RECORDING_RULES,
+                }
+            ]
+        },
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} <game name>")
+        sys.exit(1)
+    print(json.dumps(generate(sys.argv[1]), indent=2))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import yaml
+
+ROOT = (Path(os.path.dirname(__file__)) / "..").resolve()
+STATE_DIR = ROOT / ".deploy"
+
+
+def kubectl(*args):
+    return subprocess.run(["kubectl", *args], cwd=ROOT, capture_output=True, text=True)
+
+
+def cluster_id():
+    """Identify the cluster kubectl points at, deploy state is only valid for that cluster"""
+    context = kubectl("config", "current-context").stdout.strip()
+    server = kubectl("config", "view", "--minify", "-o", "jsonpath={.clusters[0].cluster.server}")
+    return f"{context or 'none'}@{server.stdout.strip() or 'none'}"
+
+
+def namespaces(game):
+    with open(ROOT / "armies" / game / "namespaces.yaml") as f:
+        return [ns["name"] for ns in yaml.safe_load(f)["namespaces"]]
+
+
+def tanks_exist(namespace=None):
+    args = ["get", "pods", "-l", "mission=tank", "-o", "name"]
+    if namespace:
+        args += ["-n", namespace]
+    proc = kubectl(*args)
+    return proc.returncode == 0 and bool(proc.stdout.strip())
+
+
+def scenario_running(scenario):
+    """Whether warnet already runs the scenario, in a pod named commander-<name without _>-<time>"""
+    prefix = "commander-" + Path(scenario).stem.replace("_", "") + "-"
+    proc = kubectl("get", "pods", "-l", "mission=commander", "-o",
+                   "jsonpath={range .items[*]}{.metadata.name} {.status.phase}{\"\\n\"}{end}")
+    for line in proc.stdout.splitlines():
+        name, _, phase = line.partition(" ")
+        if name.startswith(prefix) and phase in ("Pending", "Running"):
+            return True
+    return False
+
+
+class Step:
+    def __init__(self, name, cmd, inputs=None, outputs=None, after=None, probe=None, always=False):
+        self.name = name
+        self.cmd = cmd
+        # Files (or directories) whose content determines whether this step
+        # needs to run again
+        self.inputs = inputs or []
+        # Paths the step leaves behind locally, if any go missing we run it again
+        self.outputs = outputs or []
+        # Names of steps that must finish before this one starts
+        self.after = after or []
+        # Returns whether what the step deploys is still in the cluster
+        self.probe = probe
+        # Run on every deploy, for idempotent steps that check for themselves
+        self.always = always
+        self.digest = None
+        self.status = "pending"
+        self.elapsed = 0.0
+
+    def input_files(self):
+        files = []
+        for path in self.inputs:
+            path = ROOT / path
+            if path.is_dir():
+                files.extend(sorted(
+                    file for file in path.rglob("*")
+                    if file.is_file() and "__pycache__" not in file.parts
+                ))
+            elif path.exists():
+                files.append(path)
+        return files
+
+    def outputs_exist(self):
+        return all((ROOT / path).exists() for path in self.outputs)
+
+    def up_to_date(self, steps, state):
+        # Anything a dependency (re)deployed has to be followed by this step again
+        if self.always or any(steps[dep].status != "skipped" for dep in self.after):
+            return False
+        if state.get(self.name) != self.digest or not self.outputs_exist():
+            return False
+        return self.probe is None or self.probe()
+
+    def compute_digest(self, steps):
+        # Fold in the digests of our dependencies so a change anywhere
+        # upstream forces this step to run again as well
+        h = hashlib.sha256()
+        h.update(" ".join(self.cmd).encode())
+        for dep in self.after:
+            h.update(steps[dep].digest.encode())
+        for file in self.input_files():
+            h.update(str(file.relative_to(ROOT)).encode())
+            h.update(file.read_bytes())
+        self.digest = h.hexdigest()
+        return self.digest
+
+
+# Everything a scenario imports when warnet packages it into the commander pod
+SCENARIO_INPUTS = ["scenarios/commander.py", "scenarios/test_framework", "scenarios/ln_framework"]
+
+
+def scenario_step(name, scenario, *args, after, long_lived=True):
+    # A one-shot scenario's pod ends up Succeeded, so for those the recorded
+    # digest alone says whether it already ran
+    return Step(name, ["warnet", "run", scenario, *args],
+                inputs=[scenario] + SCENARIO_INPUTS,
+                after=after,
+                probe=(lambda: scenario_running(scenario)) if long_lived else None)
+
+
+def game_steps(game):
+    return [
+        Step("battlefield", ["warnet", "deploy", f"battlefields/{game}"],
+             inputs=[f"battlefields/{game}"],
+             probe=tanks_exist),
+        Step("armies", ["warnet", "deploy", f"armies/{game}"],
+             inputs=[f"armies/{game}"],
+             probe=lambda: kubectl("get", "namespace", *namespaces(game)).returncode == 0),
+        Step("kubeconfigs", ["warnet", "admin", "create-kubeconfigs", "--token-duration=1728000"],
+             outputs=["kubeconfigs"],
+             after=["armies"]),
+        Step("armadas", ["warnet", "deploy", f"armadas/{game}", "--to-all-users"],
+             inputs=[f"armadas/{game}"],
+             after=["kubeconfigs"],
+             probe=lambda: all(tanks_exist(ns) for ns in namespaces(game))),
+        # Funds the armadas from the miner wallet, and with --debug runs to completion
+        scenario_step("arm_armada", "scenarios/arm_armada.py", "--debug", "--admin",
+                      after=["battlefield", "armadas"], long_lived=False),
+        # Spends from the same wallet, so only start it once the armadas are funded
+        scenario_step("miner", "scenarios/miner_std.py", "--tank=miner", "--admin",
+                      after=["battlefield", "arm_armada"]),
+        scenario_step("activity", "scenarios/ln_activity.py",
+                      after=["battlefield"]),
+        # As in the old deploy.sh, these come last: the dashboard panels and the
+        # circuitbreaker limits are for the channels the miner and LN activity open.
+        # Both scripts are idempotent and cheap, so they run on every deploy.
+        Step("dashboard", ["./scripts/upload_grafana_dashboard.py", game],
+             inputs=[f"battlefields/{game}", "scripts/upload_grafana_dashboard.py",
+                     "scripts/dashboard.py", "dashboards/wrath_of_nalo.json"],
+             after=["miner", "activity"],
+             always=True),
+        Step("circuitbreakers", ["./scripts/circuitbreakers.py"],
+             inputs=["scripts/circuitbreakers.py"],
+             after=["miner", "activity"],
+             always=True),
+    ]
+
+
+def load_state(game, cluster):
+    try:
+        with open(STATE_DIR / f"{game}.json") as f:
+            return json.load(f).get(cluster, {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_state(game, cluster, state):
+    STATE_DIR.mkdir(exist_ok=True)
+    path = STATE_DIR / f"{game}.json"
+    try:
+        with open(path) as f:
+            clusters = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        clusters = {}
+    clusters[cluster] = state
+    with open(path, "w") as f:
+        json.dump(clusters, f, indent=2, sort_keys=True)
+
+
+def run_step(step):
+    print(f"--> {step.name}: {' '.join(step.cmd)}")
+    start = time.perf_counter()
+    proc = subprocess.run(step.cmd, cwd=ROOT, capture_output=True, text=True)
+    step.elapsed = time.perf_counter() - start
+    for line in (proc.stdout + proc.stderr).splitlines():
+        print(f"[{step.name}] {line}")
+    return proc.returncode
+
+
+def deploy(game, force=False, jobs=4):
+    steps = {step.name: step for step in game_steps(game)}
+    cluster = cluster_id()
+    state = load_state(game, cluster)
+    print(f"Deploying {game} to {cluster}")
+
+    # Steps are listed in dependency order so digests and skips can be decided in one pass
+    for step in steps.values():
+        step.compute_digest(steps)
+        if not force and step.up_to_date(steps, state):
+            step.status = "skipped"
+            print(f"--- {step.name}: unchanged and still deployed, skipping")
+
+    failed = False
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            for step in steps.values():
+                if step.status != "pending":
+                    continue
+                deps = [steps[dep].status for dep in step.after]
+                if any(dep in ("failed", "blocked") for dep in deps):
+                    step.status = "blocked"
+                elif all(dep in ("done", "skipped") for dep in deps):
+                    step.status = "running"
+                    running[pool.submit(run_step, step)] = step
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                if future.result() == 0:
+                    step.status = "done"
+                    state[step.name] = step.digest
+                    save_state(game, cluster, state)
+                else:
+                    step.status = "failed"
+                    failed = True
+                    print(f"!!! {step.name} failed")
+
+    print(f"\nDeploy summary for {game}:")
+    for step in steps.values():
+        print(f"  {step.name:<16} {step.status:<8} {step.elapsed:8.1f}s")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deploy a Wrath of Nalo game")
+    parser.add_argument("game", help="Game name, e.g. signet100 or regtest_jam")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every step even if its inputs are unchanged since the last deploy",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Maximum number of steps to run concurrently (default 4)",
+    )
+    args = parser.parse_args()
+    sys.exit(0 if deploy(args.game, args.force, args.jobs) else 1)
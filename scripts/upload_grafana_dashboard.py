@@ -2,25 +2,50 @@
 
 import json
 import os
+import subprocess
+import sys
 import requests
-from pathlib import Path
+import yaml
 from warnet.k8s import wait_for_ingress_endpoint, get_ingress_ip_or_host
 
+sys.path.append(os.path.dirname(__file__))
+from dashboard import DASHBOARD_UID, generate, recording_rules  # noqa: E402
+
+if len(sys.argv) != 2:
+    print(f"Usage: {sys.argv[0]} <game name>")
+    sys.exit(1)
+
+data = generate(sys.argv[1])
+
 wait_for_ingress_endpoint()
 ip = get_ingress_ip_or_host()
 
-dashboard_file = Path(os.path.dirname(__file__)) / '..' / 'dashboards' / 'wrath_of_nalo.json'
-url = f"http://{ip}/grafana/api/dashboards/db"
+url = f"http://{ip}/grafana/api/dashboards"
 auth = ("admin", "password")
 headers = {"Content-Type": "application/json"}
 print(url)
-with open(dashboard_file) as f:
-    data = json.load(f)
+
+# The generated panels query these pre-aggregated series. Apply them on every
+# run, they may be gone even if Grafana still has the dashboard.
+subprocess.run(
+    ["kubectl", "apply", "-f", "-"],
+    input=yaml.dump(recording_rules(), default_flow_style=False),
+    text=True,
+    check=True,
+)
+
+# Skip the upload entirely if Grafana already has this exact dashboard
+resp = requests.get(f"{url}/uid/{DASHBOARD_UID}", auth=auth)
+if resp.ok and resp.json()["dashboard"].get("description") == data["description"]:
+    print(f"Dashboard unchanged ({data['description']}), not uploading")
+    sys.exit(0)
 
 payload = {
     "dashboard": data,
     "overwrite": True
 }
 
-resp = requests.post(url, headers=headers, auth=auth, data=json.dumps(payload))
+resp = requests.post(f"{url}/db", headers=headers, auth=auth, data=json.dumps(payload))
 print(resp.status_code, resp.text)
+if not resp.ok:
+    sys.exit(1)